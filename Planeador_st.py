@@ -1,153 +1,185 @@
 import streamlit as st
-import json
+import functools
 import os
-import re
-import sys
-from datetime import timedelta, date, datetime
-import io
-import base64
+from datetime import timedelta
+import threading
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from streamlit_quill import st_quill
 
-# --- ReportLab Imports ---
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.lib.units import inch
-from reportlab.lib import colors
+from assets import ICON_PX, UI_LOGO_IMM_PX, UI_LOGO_SEP_PX, image_base64, image_bytes
+from autosave import get_journal, new_journal_id, valid_journal_id
+import pdf_spool
+import rerun_profiler
+from pdf_jobs import PdfCancelled, bundle_hash, export_hash, plan_hash, submit_bundle_job, submit_export_job, submit_pdf_job
+from plan_search import clean_html, get_index
+from plan_format import COMPACT_SUFFIX, dumps_compact, loads_plan
+from plan_schema import changed_fields, empty_day, plan_json, plan_to_state, state_defaults, state_to_plan
+from plan_store import get_store
+from rubric_store import refresh_plan_rubrics, store_rubric_upload
+from school_calendar import class_dates, non_working_days_in_range
+from timetable_import import read_timetable, skeleton_plans
 
 # --- Configuration ---
 st.set_page_config(page_title="Planeador Docente IMM", page_icon="📝", layout="wide")
+rerun_profiler.start(st.session_state) # No-op unless PLANEADOR_PERFIL=1
 
 # --- Helper Functions ---
 
-def _get_full_path(path):
-    """
-    Get the absolute path for a file, handling both script execution and PyInstaller (if used later).
-    Checks current directory first.
-    """
-    cwd_path = os.path.join(os.getcwd(), path)
-    if os.path.exists(cwd_path):
-        return cwd_path
-    
-    alt_path = os.path.join(r"C:\Users\jaime\Documents\My planer", path)
-    if os.path.exists(alt_path):
-        return alt_path
+def _in_session_thread(func):
+    """Wraps a deferred download callable so it can read st.session_state from Streamlit's worker thread."""
+    ctx = get_script_run_ctx()
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func()
+    return run
 
-    try:
-        base = sys._MEIPASS
-    except AttributeError:
-        base = os.path.dirname(os.path.abspath(__file__))
-    
-    full = os.path.join(base, path)
-    return full
-
-def get_image_base64(path):
-    """Encodes an image to base64 for embedding in HTML."""
-    full_path = _get_full_path(path)
-    if os.path.exists(full_path):
-        with open(full_path, "rb") as f:
-            data = f.read()
-        return base64.b64encode(data).decode()
-    return ""
-
-def html_to_reportlab(html_text):
+def download_file(label, result, file_name, mime, key=None):
     """
-    Convert Quill HTML to ReportLab XML tags.
+    Download control for a finished PDF or ZIP: bytes, or a pdf_spool.SpooledFile.
+    A spooled file is streamed from disk by static serving, or else read only when clicked.
     """
-    if not html_text:
-        return ""
-    
-    # Remove <p> tags, replacing closing </p> with <br/>
-    text = html_text.replace("</p>", "<br/>").replace("<p>", "")
-    
-    # Bold - Handle <strong>, <b>, and span with font-weight: bold
-    text = re.sub(r'<span[^>]*style="[^"]*font-weight:\s*bold[^"]*"[^>]*>(.*?)</span>', r'<b>\1</b>', text, flags=re.IGNORECASE)
-    text = text.replace("<strong>", "<b>").replace("</strong>", "</b>")
-    
-    # Italic - Handle <em>, <i>, and span with font-style: italic
-    text = re.sub(r'<span[^>]*style="[^"]*font-style:\s*italic[^"]*"[^>]*>(.*?)</span>', r'<i>\1</i>', text, flags=re.IGNORECASE)
-    text = text.replace("<em>", "<i>").replace("</em>", "</i>")
-    
-    # Underline
-    text = text.replace("<u>", "<u>").replace("</u>", "</u>")
-    
-    # Lists
-    text = text.replace("<ul>", "").replace("</ul>", "")
-    text = text.replace("<ol>", "").replace("</ol>", "")
-    text = text.replace("<li>", "<br/>• ").replace("</li>", "")
-    
-    # Clean up initial <br/> if any
-    if text.startswith("<br/>"):
-        text = text[5:]
-            
-    return text
-
-def _embed_image_to_pdf(path, content_list, page_width):
-    if path and os.path.exists(path):
-        try:
-            img = RLImage(path, width=page_width, height=4*inch, kind='proportional')
-            content_list.append(img)
-            content_list.append(Spacer(1, 0.1 * inch))
-        except Exception as e:
-            content_list.append(Paragraph(f"<i>[Error al cargar imagen: {os.path.basename(path)}]</i>", getSampleStyleSheet()['Italic']))
-
-def parse_date(date_str):
-    """Parses a date string trying ISO format first, then DD/MM/YYYY."""
-    if not date_str:
-        return date.today()
+    if not isinstance(result, pdf_spool.SpooledFile):
+        st.download_button(label, data=result, file_name=file_name, mime=mime, key=key)
+    elif result.url and st.get_option("server.enableStaticServing"):
+        st.link_button(label, result.url, key=key)
+    else:
+        st.download_button(label, data=result.read, file_name=file_name, mime=mime, key=key)
+
+def render_export_status(polling=False):
+    """Progress, then download, of the merged export of repository search results (st.session_state.repo_export)."""
+    job = st.session_state.repo_export[1]
+    if job.running():
+        st.progress(job.progress, text=f"Generando PDF ({job.done}/{job.total} planeaciones)")
+        if st.button("Cancelar", key="repo_export_cancelar"):
+            job.cancel()
+            st.session_state.repo_export = None
+            st.rerun()
+        return
+
+    if polling:
+        st.rerun() # Re-register the fragment without the polling timer
+
     try:
-        return date.fromisoformat(date_str)
-    except ValueError:
-        try:
-            return datetime.strptime(date_str, "%d/%m/%Y").date()
-        except ValueError:
-            return date.today()
+        pdf, contents, errores = job.result()
+        download_file("Descargar PDF del periodo", pdf, "Planeaciones_periodo.pdf", "application/pdf", key="repo_export_descargar")
+        st.success(f"{len(contents)} planeaciones exportadas ({sum(n for _, _, n in contents)} páginas).")
+        for etiqueta, error in errores:
+            st.error(f"{etiqueta}: {error}")
+    except PdfCancelled:
+        st.info("Exportación cancelada.")
+    except Exception as e:
+        st.error(f"Error al exportar: {e}")
 
 # --- Initialization & State ---
 
 def init_session_state():
-    defaults = {
-        "docente_titulo": "Dr.",
-        "docente_nombre": "",
-        "curso_grado": "1ro",
-        "curso_grupos": [],
-        "curso_materia": "Matematicas",
-        "curso_campo": "Lenguajes",
-        "plan_metodologia": "Seleccione metodología",
-        "plan_fecha_inicio": date.today(),
-        "plan_fecha_fin": date.today(),
-        "plan_dias": [],
-        "plan_eje1": "Seleccione eje",
-        "plan_eje2": "Seleccione eje",
-        "plan_eje3": "Seleccione eje",
-        "plan_disc1": "Seleccione materia",
-        "plan_disc2": "Seleccione materia",
-        "plan_disc3": "Seleccione materia",
-        "text_problematica": "",
-        "text_pda": "",
-        "text_objetivos": "",
-        "text_perfiles": "",
-        "text_producto": "",
-        "abpj_presentacion": "",
-        "abpj_recoleccion": "",
-        "abpj_formulacion": "",
-        "abpj_organizacion": "",
-        "abpj_experiencia": "",
-        "abpj_resultados": "",
-        "abpj_materiales": "",
-        "abpj_evaluacion": "",
-        "abpj_rubrica_path": None,
-        "daily_plan_data": {},
+    defaults = state_defaults()
+    defaults.update({
         "last_loaded_file_id": None,
-        "quill_key_suffix": 0 # Force Quill refresh
-    }
+        "tab4_semana": 0, # Week shown in the daily-session navigator
+        "pdf_job": None, # Background PDF build (pdf_jobs.PdfJob)
+        "pdf_job_version": None, # pdf_job_version() when pdf_job was requested
+        "pdf_por_grupo": False, # One PDF per grupo, as a ZIP
+        "pdf_por_disciplina": False, # ...and per linked disciplina
+        "plan_version": 0, # Bumped on every plan edit; keys the cached JSON download
+        "formato_guardado": "JSON",
+        "repo_plan_id": None, # Id of the open plan in the SQLite repository, once saved there
+        "repo_export": None, # (plan ids, pdf_jobs.PdfJob) of the last merged export of search results
+        "repo_resultados": None, # Rows of the last repository search; None until the first one
+        "repo_buscar_pendiente": False, # A filter changed (or plans were saved): search again on this run
+        "editor_rev": {} # Quill field or daily entry -> revision; bumped when a loaded plan replaces its value
+    })
 
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
 
-init_session_state()
+with rerun_profiler.section(st.session_state, "estado_inicial"):
+    init_session_state()
+
+def mark_plan_dirty():
+    st.session_state.plan_version += 1
+
+def set_plan_field(key, value):
+    """Stores an editor value, bumping plan_version only when it actually changed."""
+    if st.session_state[key] != value:
+        st.session_state[key] = value
+        mark_plan_dirty()
+
+def set_day_field(day_data, field, value):
+    if day_data[field] != value:
+        day_data[field] = value
+        mark_plan_dirty()
+
+def _repo_search_again():
+    st.session_state.repo_buscar_pendiente = True
+
+def quill_key(prefix, field):
+    """
+    Widget key of a Quill editor. It only changes (remounting the editor) when a loaded
+    plan replaced the field; the editors of a daily entry share the revision of its dia_nombre.
+    """
+    return f"{prefix}_{st.session_state.editor_rev.get(field, 0)}"
+
+def load_plan(data):
+    """Applies a loaded plan dict, touching only the state keys and editors whose values differ."""
+    refresh_plan_rubrics(data)
+    incoming = plan_to_state(data)
+    keys, day_fields = changed_fields(st.session_state, incoming)
+    for key in keys:
+        st.session_state[key] = incoming[key]
+    for field in keys + sorted({name for name, _ in day_fields}):
+        st.session_state.editor_rev[field] = st.session_state.editor_rev.get(field, 0) + 1
+    if keys:
+        mark_plan_dirty()
+
+def init_autosave():
+    """
+    Binds the session to an autosave journal named in the URL (?borrador=...), so a new
+    session opened on the same URL (server restart, dropped connection) restores the plan.
+    """
+    if "autosave_id" in st.session_state:
+        return
+    journal_id = st.query_params.get("borrador")
+    restored = None
+    if valid_journal_id(journal_id):
+        restored = get_journal(journal_id).restore()
+    else:
+        journal_id = new_journal_id()
+        st.query_params["borrador"] = journal_id
+    if restored is not None:
+        load_plan(restored)
+        st.toast("Se recuperó el borrador guardado automáticamente.", icon="💾")
+    st.session_state.autosave_id = journal_id
+    st.session_state.autosave_version = st.session_state.plan_version
+
+with rerun_profiler.section(st.session_state, "estado_inicial"):
+    init_autosave()
+
+def autosave_tick():
+    """Hands the plan to its autosave journal if it changed; the journal writes it out debounced."""
+    if st.session_state.autosave_version != st.session_state.plan_version:
+        st.session_state.autosave_version = st.session_state.plan_version
+        get_journal(st.session_state.autosave_id).record(get_current_data())
+
+def autosaved(func):
+    """Runs autosave_tick() after a fragment body, since fragment reruns skip the end of the script."""
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        result = func(*args, **kwargs)
+        autosave_tick()
+        return result
+    return run
+
+def profiled(name, standalone=False):
+    """Times a fragment as section name of the rerun profile (see rerun_profiler), also when it reruns alone."""
+    def wrap(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            with rerun_profiler.section(st.session_state, name, standalone):
+                return func(*args, **kwargs)
+        return run
+    return wrap
 
 # --- Lists ---
 LISTA_MATERIAS = ["Matematicas", "Matematicas I", "Matematicas II", "Matematicas III", "Español", "Español I", "Español II", "Español III", "Educación Civica y Etica", "Educación Civica y Etica I", "Educación Civica y Etica II", "Educación Civica y Etica III", "Ingles", "Ingles I", "Ingles II", "Ingles III", "Informatica", "Informatica I", "Informatica II", "Informatica III", "Historia", "Historia I", "Historia II", "Historia III", "Educación Fisica", "Artes", "Ciencias", "Biología", "Fisica", "Quimica"]
@@ -156,13 +188,15 @@ LISTA_EJES = ["Seleccione eje", "Pensamiento Crítico", "Interculturalidad Crít
 LISTA_CAMPOS = ["Lenguajes", "Saberes y Pensamiento Científico", "Ética, Naturaleza y Sociedades", "De lo Humano y lo Comunitario"]
 LISTA_GRUPOS = ["A", "B", "C", "D", "E", "F"]
 LISTA_DIAS = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"]
+REPO_LIMITE = 2000 # Repository search results: a whole school's plans for a term, the scope of a merged export
 
 # --- Floating Help Button CSS ---
-help_img_b64 = get_image_base64("Help.png")
-gemini_img_b64 = get_image_base64("Gemini.png")
-deepseek_img_b64 = get_image_base64("DeepSeek.png")
+with rerun_profiler.section(st.session_state, "botones_flotantes"):
+    help_img_b64 = image_base64("Help.png", ICON_PX)
+    gemini_img_b64 = image_base64("Gemini.png", ICON_PX)
+    deepseek_img_b64 = image_base64("DeepSeek.png", ICON_PX)
 
-st.markdown(f"""
+    st.markdown(f"""
 <style>
 .floating-container {{
     position: fixed;
@@ -225,63 +259,19 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 # --- Sidebar Actions ---
-with st.sidebar:
+with st.sidebar, rerun_profiler.section(st.session_state, "barra_lateral"):
     st.header("Acciones")
     
-    uploaded_file = st.file_uploader("Cargar Planeación (JSON)", type="json")
+    uploaded_file = st.file_uploader("Cargar Planeación (JSON)", type=["json", "gz"])
     
     if uploaded_file is not None:
         file_id = f"{uploaded_file.name}_{uploaded_file.size}"
         
         if file_id != st.session_state.last_loaded_file_id:
             try:
-                data = json.load(uploaded_file)
-                docente = data.get("docente", {})
-                st.session_state.docente_titulo = docente.get("titulo", "Dr.")
-                st.session_state.docente_nombre = docente.get("nombre", "")
-                
-                curso = data.get("curso", {})
-                st.session_state.curso_grado = curso.get("grado", "1ro")
-                st.session_state.curso_grupos = curso.get("grupos", [])
-                st.session_state.curso_materia = curso.get("materia", "Matematicas")
-                st.session_state.curso_campo = curso.get("campo", "Lenguajes")
-                
-                plan = data.get("planeacion", {})
-                st.session_state.plan_metodologia = plan.get("metodologia", "Seleccione metodología")
-                
-                # Use new parse_date function
-                st.session_state.plan_fecha_inicio = parse_date(plan.get("fecha_inicio"))
-                st.session_state.plan_fecha_fin = parse_date(plan.get("fecha_fin"))
-                
-                st.session_state.plan_dias = plan.get("dias_planeados", [])
-                st.session_state.plan_eje1 = plan.get("eje1", "Seleccione eje")
-                st.session_state.plan_eje2 = plan.get("eje2", "Seleccione eje")
-                st.session_state.plan_eje3 = plan.get("eje3", "Seleccione eje")
-                st.session_state.plan_disc1 = plan.get("disciplina1", "Seleccione materia")
-                st.session_state.plan_disc2 = plan.get("disciplina2", "Seleccione materia")
-                st.session_state.plan_disc3 = plan.get("disciplina3", "Seleccione materia")
-                
-                st.session_state.text_problematica = plan.get("problematica", "")
-                st.session_state.text_pda = plan.get("pda", "")
-                st.session_state.text_objetivos = plan.get("objetivos", "")
-                st.session_state.text_perfiles = plan.get("perfiles", "")
-                st.session_state.text_producto = plan.get("producto", "")
-                
-                abpj = plan.get("secuencia_abpj", {})
-                st.session_state.abpj_presentacion = abpj.get("presentacion", "")
-                st.session_state.abpj_recoleccion = abpj.get("recoleccion", "")
-                st.session_state.abpj_formulacion = abpj.get("formulacion", "")
-                st.session_state.abpj_organizacion = abpj.get("organizacion", "")
-                st.session_state.abpj_experiencia = abpj.get("experiencia", "")
-                st.session_state.abpj_resultados = abpj.get("resultados", "")
-                st.session_state.abpj_materiales = abpj.get("materiales", "")
-                st.session_state.abpj_evaluacion = abpj.get("evaluacion", "")
-                
-                daily_list = plan.get("secuencia_diaria", [])
-                st.session_state.daily_plan_data = {item["dia_nombre"]: item for item in daily_list}
-                
+                load_plan(loads_plan(uploaded_file.getvalue()))
                 st.session_state.last_loaded_file_id = file_id
-                st.session_state.quill_key_suffix += 1 # Force Quill refresh
+                st.session_state.repo_plan_id = None # A file upload is a new plan in the repository
                 st.success("Planeación cargada correctamente.")
                 st.rerun()
             except Exception as e:
@@ -292,80 +282,148 @@ with st.sidebar:
         start = st.session_state.plan_fecha_inicio
         end = st.session_state.plan_fecha_fin
         active_days = st.session_state.plan_dias
-        dias_map = {0: "Lunes", 1: "Martes", 2: "Miércoles", 3: "Jueves", 4: "Viernes"}
         
-        if start <= end:
-            delta = end - start
-            for i in range(delta.days + 1):
-                current = start + timedelta(days=i)
-                wd = current.weekday()
-                if wd in dias_map:
-                    dia_nombre = dias_map[wd]
-                    if dia_nombre in active_days:
-                        key = f"{dia_nombre} {current.strftime('%d/%m/%Y')}"
-                        if key in st.session_state.daily_plan_data:
-                            daily_sequence.append(st.session_state.daily_plan_data[key])
-                        else:
-                            daily_sequence.append({
-                                "dia_nombre": key, "inicio": "", "desarrollo": "", "cierre": "",
-                                "materiales": "", "evaluacion": "", "rubrica_path": ""
-                            })
-
-        return {
-            "docente": {
-                "titulo": st.session_state.docente_titulo,
-                "nombre": st.session_state.docente_nombre
-            },
-            "curso": {
-                "grado": st.session_state.curso_grado,
-                "grupos": st.session_state.curso_grupos,
-                "materia": st.session_state.curso_materia,
-                "campo": st.session_state.curso_campo
-            },
-            "planeacion": {
-                "metodologia": st.session_state.plan_metodologia,
-                "fecha_inicio": st.session_state.plan_fecha_inicio.isoformat(),
-                "fecha_fin": st.session_state.plan_fecha_fin.isoformat(),
-                "dias_planeados": st.session_state.plan_dias,
-                "problematica": st.session_state.text_problematica,
-                "pda": st.session_state.text_pda,
-                "objetivos": st.session_state.text_objetivos,
-                "perfiles": st.session_state.text_perfiles,
-                "producto": st.session_state.text_producto,
-                "eje1": st.session_state.plan_eje1,
-                "eje2": st.session_state.plan_eje2,
-                "eje3": st.session_state.plan_eje3,
-                "disciplina1": st.session_state.plan_disc1,
-                "disciplina2": st.session_state.plan_disc2,
-                "disciplina3": st.session_state.plan_disc3,
-                "secuencia_abpj": {
-                    "presentacion": st.session_state.abpj_presentacion,
-                    "recoleccion": st.session_state.abpj_recoleccion,
-                    "formulacion": st.session_state.abpj_formulacion,
-                    "organizacion": st.session_state.abpj_organizacion,
-                    "experiencia": st.session_state.abpj_experiencia,
-                    "resultados": st.session_state.abpj_resultados,
-                    "materiales": st.session_state.abpj_materiales,
-                    "evaluacion": st.session_state.abpj_evaluacion,
-                    "rubrica_path": st.session_state.abpj_rubrica_path
-                },
-                "secuencia_diaria": daily_sequence
-            }
-        }
-
-    json_data = json.dumps(get_current_data(), indent=4, ensure_ascii=False)
-    st.download_button("Guardar Planeación (JSON)", data=json_data, file_name="planeacion.json", mime="application/json")
+        for current, dia_nombre in class_dates(start, end, active_days):
+            key = f"{dia_nombre} {current.strftime('%d/%m/%Y')}"
+            if key in st.session_state.daily_plan_data:
+                daily_sequence.append(st.session_state.daily_plan_data[key])
+            else:
+                daily_sequence.append(empty_day(key))
+
+        return state_to_plan(st.session_state, daily_sequence)
+
+    @profiled("json_guardado", standalone=True) # Runs on click, outside any script run
+    def get_plan_json():
+        # Serialized at most once per plan version and format
+        version = (st.session_state.plan_version, st.session_state.formato_guardado)
+        cached = st.session_state.get("_plan_json_cache")
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if st.session_state.formato_guardado == "Comprimido":
+            payload = dumps_compact(get_current_data())
+        elif st.session_state.formato_guardado == "JSON compacto":
+            payload = plan_json(get_current_data(), separators=(",", ":"))
+        else:
+            payload = plan_json(get_current_data(), indent=4)
+        st.session_state._plan_json_cache = (version, payload)
+        return payload
+
+    st.radio("Formato", ["JSON", "JSON compacto", "Comprimido"], key="formato_guardado", horizontal=True,
+             help="JSON compacto omite la sangría; Comprimido (.json.gz) guarda una sola vez los textos repetidos y es el más pequeño para planeaciones largas")
+
+    # Tab fragments rerun without refreshing the sidebar, so the JSON is built on click
+    comprimido = st.session_state.formato_guardado == "Comprimido"
+    st.download_button("Guardar Planeación (JSON)", data=_in_session_thread(get_plan_json),
+                       file_name="planeacion" + (COMPACT_SUFFIX if comprimido else ".json"),
+                       mime="application/gzip" if comprimido else "application/json")
+
+    with st.expander("Repositorio de planeaciones"):
+        # The store is only opened, and searched, when something here is used; the expander renders on every rerun
+        if st.button("💾 Guardar en el repositorio", key="repo_guardar"):
+            plan_id, escritos = get_store().save(get_current_data(), st.session_state.repo_plan_id)
+            st.session_state.repo_plan_id = plan_id
+            st.session_state.repo_buscar_pendiente = st.session_state.repo_resultados is not None
+            st.success(f"Planeación #{plan_id} guardada ({escritos} campos actualizados).")
+
+        horario = st.file_uploader("Crear planeaciones desde el horario (CSV)", type=["csv"], key="repo_horario",
+                                   help="Columnas: docente, materia, grado, grupos y dias; opcionales: titulo, campo, metodologia, fecha_inicio y fecha_fin. Las filas sin fechas usan el periodo indicado abajo.")
+        if horario is not None:
+            horario_periodo = st.date_input("Periodo de las filas sin fechas", value=(), key="repo_horario_periodo")
+            if st.button("🗓️ Crear planeaciones del horario", key="repo_horario_crear"):
+                desde, hasta = horario_periodo if len(horario_periodo) == 2 else (None, None)
+                try:
+                    filas = read_timetable(horario.getvalue().decode("utf-8-sig"), desde, hasta)
+                except (UnicodeDecodeError, ValueError) as e:
+                    st.error(f"Horario no válido: {e}")
+                else:
+                    ids = get_store().save_many((data for _, data in skeleton_plans(filas)), skip_existing=True)
+                    creados = sum(i is not None for i in ids)
+                    st.session_state.repo_buscar_pendiente = st.session_state.repo_resultados is not None
+                    st.success(f"{creados} planeaciones creadas en el repositorio."
+                               + (f" {len(ids) - creados} ya existían y se omitieron." if creados < len(ids) else ""))
+        
+        st.caption("Buscar planeaciones guardadas")
+        f1, f2 = st.columns(2)
+        with f1: repo_materia = st.selectbox("Materia", ["Todas"] + LISTA_MATERIAS, key="repo_materia", on_change=_repo_search_again)
+        with f2: repo_grado = st.selectbox("Grado", ["Todos", "1ro", "2do", "3ro"], key="repo_grado", on_change=_repo_search_again)
+        repo_grupo = st.selectbox("Grupo", ["Todos"] + LISTA_GRUPOS, key="repo_grupo", on_change=_repo_search_again)
+        repo_docente = st.text_input("Docente", key="repo_docente", on_change=_repo_search_again)
+        repo_fechas = st.date_input("Periodo", value=(), key="repo_fechas", on_change=_repo_search_again)
+        
+        if st.button("🔎 Buscar", key="repo_buscar") or st.session_state.repo_buscar_pendiente:
+            st.session_state.repo_buscar_pendiente = False
+            st.session_state.repo_resultados = get_store().search(
+                docente=repo_docente,
+                materia=None if repo_materia == "Todas" else repo_materia,
+                grado=None if repo_grado == "Todos" else repo_grado,
+                grupo=None if repo_grupo == "Todos" else repo_grupo,
+                desde=repo_fechas[0].isoformat() if len(repo_fechas) > 0 else None,
+                hasta=repo_fechas[-1].isoformat() if len(repo_fechas) > 0 else None,
+                limit=REPO_LIMITE,
+            )
+        planes = st.session_state.repo_resultados
+        if planes is None:
+            st.caption("Elija los filtros y pulse Buscar.")
+        elif not planes:
+            st.caption("Sin resultados.")
+        else:
+            store = get_store()
+            if len(planes) >= REPO_LIMITE:
+                st.warning(f"Se muestran solo las {REPO_LIMITE} planeaciones guardadas más recientemente; el PDF del periodo no incluirá las demás. Acote los filtros.")
+            etiquetas = {p["id"]: f"#{p['id']} {p['materia']} {p['grado']} {p['grupos']} · {p['docente']} · {p['fecha_inicio']} a {p['fecha_fin']}" for p in planes}
+            elegido = st.selectbox(f"{len(planes)} planeaciones", list(etiquetas), format_func=etiquetas.get, key="repo_elegido")
+            if st.button("Abrir", key="repo_abrir"):
+                load_plan(store.load(elegido))
+                st.session_state.repo_plan_id = elegido
+                st.rerun()
+
+            ids = [p["id"] for p in planes]
+            exportacion = st.session_state.repo_export
+            if exportacion is not None and exportacion[0] != ids:
+                # The results changed: stop their export and hide its download
+                exportacion[1].cancel()
+                exportacion = st.session_state.repo_export = None
+            if st.button(f"📚 Exportar las {len(planes)} en un PDF con índice", key="repo_exportar"):
+                job = exportacion[1] if exportacion is not None else None
+                if job is None or job.key != export_hash(planes) or job.cancelled() or (not job.running() and job.future.exception() is not None):
+                    if job is not None:
+                        job.cancel()
+                    exportacion = st.session_state.repo_export = (ids, submit_export_job(planes))
+            if exportacion is not None:
+                running = exportacion[1].running()
+                st.fragment(render_export_status, run_every=0.5 if running else None)(polling=running)
+
+    with st.expander("Buscar en planeaciones archivadas"):
+        indice = get_index()
+        archivo_dir = st.text_input("Directorio del archivo", value=os.environ.get("PLANEADOR_ARCHIVO", ""), key="busqueda_dir")
+        if st.button("Actualizar índice", key="busqueda_indexar", disabled=not archivo_dir):
+            if os.path.isdir(archivo_dir):
+                with st.spinner("Indexando..."):
+                    r = indice.index_directory(archivo_dir)
+                st.success(f"{r['indexados']} indexadas, {r['sin_cambios']} sin cambios, {r['eliminados']} eliminadas, {r['errores']} con error.")
+            else:
+                st.error(f"No existe el directorio: {archivo_dir}")
+        
+        consulta = st.text_input("Buscar texto", key="busqueda_texto", placeholder="p. ej. fracciones equivalentes")
+        if consulta:
+            resultados = indice.search(consulta)
+            if not resultados:
+                st.caption("Sin resultados.")
+            for hit in resultados:
+                st.markdown(f"**{hit['label']}** · {hit['campo']}\n\n{hit['snippet']}")
+                st.caption(os.path.basename(hit["path"]))
 
 
 # --- Main UI ---
 
-col1, col2, col3 = st.columns([1, 3, 1])
-with col1:
-    logo_imm = _get_full_path("LOGO imm.png")
-    if os.path.exists(logo_imm):
-        st.image(logo_imm, width=150)
-with col2:
-    st.markdown("""
+with rerun_profiler.section(st.session_state, "encabezado"):
+    col1, col2, col3 = st.columns([1, 3, 1])
+    with col1:
+        logo_imm = image_bytes("LOGO imm.png", UI_LOGO_IMM_PX)
+        if logo_imm:
+            st.image(logo_imm, width=150)
+    with col2:
+        st.markdown("""
     <div style='text-align: center;'>
         <h3>Secretaría De Educación Pública</h3>
         <h4>Dirección De Educación Secundaria</h4>
@@ -373,58 +431,78 @@ with col2:
         <h2>Planeaciones Docente</h2>
     </div>
     """, unsafe_allow_html=True)
-with col3:
-    logo_sep = _get_full_path("logo_sep.png")
-    if os.path.exists(logo_sep):
-        st.image(logo_sep, width=180)
+    with col3:
+        logo_sep = image_bytes("logo_sep.png", UI_LOGO_SEP_PX)
+        if logo_sep:
+            st.image(logo_sep, width=180)
 
 st.markdown("---")
 
 tab1, tab2, tab3, tab4 = st.tabs(["Docente y Curso", "Detalles Generales", "Contenido", "Secuencia Didáctica"])
 
-with tab1:
+# Each tab (and each daily session in tab4) is a fragment: editing a field only
+# reruns its own unit instead of the whole script.
+
+def _request_app_rerun():
+    mark_plan_dirty()
+    st.session_state._app_rerun_requested = True
+
+@st.fragment
+@profiled("tab1")
+@autosaved
+def render_tab1():
     col_d1, col_d2 = st.columns(2)
     with col_d1:
         st.subheader("Información Docente")
-        st.selectbox("Título", ["Dr.", "Dra.", "Mtro.", "Mtra.", "Prof.", "Pasante."], key="docente_titulo")
-        st.text_input("Nombre Completo", key="docente_nombre")
+        st.selectbox("Título", ["Dr.", "Dra.", "Mtro.", "Mtra.", "Prof.", "Pasante."], key="docente_titulo", on_change=mark_plan_dirty)
+        st.text_input("Nombre Completo", key="docente_nombre", on_change=mark_plan_dirty)
     
     with col_d2:
         st.subheader("Información Curso")
         c1, c2 = st.columns(2)
         with c1:
-            st.selectbox("Grado", ["1ro", "2do", "3ro"], key="curso_grado")
+            st.selectbox("Grado", ["1ro", "2do", "3ro"], key="curso_grado", on_change=mark_plan_dirty)
         with c2:
-            st.multiselect("Grupos", LISTA_GRUPOS, key="curso_grupos")
+            st.multiselect("Grupos", LISTA_GRUPOS, key="curso_grupos", on_change=mark_plan_dirty)
         
-        st.selectbox("Materia", LISTA_MATERIAS, key="curso_materia")
-        st.selectbox("Campo Formativo", LISTA_CAMPOS, key="curso_campo")
+        st.selectbox("Materia", LISTA_MATERIAS, key="curso_materia", on_change=mark_plan_dirty)
+        st.selectbox("Campo Formativo", LISTA_CAMPOS, key="curso_campo", on_change=mark_plan_dirty)
 
-with tab2:
+@st.fragment
+@profiled("tab2")
+@autosaved
+def render_tab2():
     st.subheader("Detalles de la Planeación")
-    st.selectbox("Metodología", LISTA_METODOLOGIA, key="plan_metodologia")
+    # Methodology, dates and days reshape tab4, so they trigger a full rerun
+    st.selectbox("Metodología", LISTA_METODOLOGIA, key="plan_metodologia", on_change=_request_app_rerun)
     
     col_t1, col_t2 = st.columns(2)
     with col_t1:
-        st.date_input("Fecha Inicio", format="DD/MM/YYYY", key="plan_fecha_inicio")
+        st.date_input("Fecha Inicio", format="DD/MM/YYYY", key="plan_fecha_inicio", on_change=_request_app_rerun)
     with col_t2:
-        st.date_input("Fecha Fin", format="DD/MM/YYYY", key="plan_fecha_fin")
+        st.date_input("Fecha Fin", format="DD/MM/YYYY", key="plan_fecha_fin", on_change=_request_app_rerun)
     
-    st.multiselect("Días de Clase", LISTA_DIAS, key="plan_dias")
+    st.multiselect("Días de Clase", LISTA_DIAS, key="plan_dias", on_change=_request_app_rerun)
     
     st.markdown("**Ejes Articuladores**")
     c_e1, c_e2, c_e3 = st.columns(3)
-    with c_e1: st.selectbox("Eje 1", LISTA_EJES, key="plan_eje1")
-    with c_e2: st.selectbox("Eje 2", LISTA_EJES, key="plan_eje2")
-    with c_e3: st.selectbox("Eje 3", LISTA_EJES, key="plan_eje3")
+    with c_e1: st.selectbox("Eje 1", LISTA_EJES, key="plan_eje1", on_change=mark_plan_dirty)
+    with c_e2: st.selectbox("Eje 2", LISTA_EJES, key="plan_eje2", on_change=mark_plan_dirty)
+    with c_e3: st.selectbox("Eje 3", LISTA_EJES, key="plan_eje3", on_change=mark_plan_dirty)
     
     st.markdown("**Materias Vinculadas**")
     c_m1, c_m2, c_m3 = st.columns(3)
-    with c_m1: st.selectbox("Materia 1", ["Seleccione materia"] + LISTA_MATERIAS, key="plan_disc1")
-    with c_m2: st.selectbox("Materia 2", ["Seleccione materia"] + LISTA_MATERIAS, key="plan_disc2")
-    with c_m3: st.selectbox("Materia 3", ["Seleccione materia"] + LISTA_MATERIAS, key="plan_disc3")
+    with c_m1: st.selectbox("Materia 1", ["Seleccione materia"] + LISTA_MATERIAS, key="plan_disc1", on_change=mark_plan_dirty)
+    with c_m2: st.selectbox("Materia 2", ["Seleccione materia"] + LISTA_MATERIAS, key="plan_disc2", on_change=mark_plan_dirty)
+    with c_m3: st.selectbox("Materia 3", ["Seleccione materia"] + LISTA_MATERIAS, key="plan_disc3", on_change=mark_plan_dirty)
 
-with tab3:
+    if st.session_state.pop("_app_rerun_requested", False):
+        st.rerun()
+
+@st.fragment
+@profiled("tab3")
+@autosaved
+def render_tab3():
     st.subheader("Contenido Pedagógico")
     # Quill Editor Configuration
     toolbar = [
@@ -432,43 +510,64 @@ with tab3:
         [{'list': 'ordered'}, {'list': 'bullet'}]
     ]
     
-    # Use key suffix to force refresh
-    ks = st.session_state.quill_key_suffix
-    
-    st.session_state.text_problematica = st_quill(value=st.session_state.text_problematica, placeholder="Problemática Contextual", toolbar=toolbar, key=f"quill_prob_{ks}")
-    st.session_state.text_pda = st_quill(value=st.session_state.text_pda, placeholder="PDA", toolbar=toolbar, key=f"quill_pda_{ks}")
-    st.session_state.text_objetivos = st_quill(value=st.session_state.text_objetivos, placeholder="Objetivos", toolbar=toolbar, key=f"quill_obj_{ks}")
-    st.session_state.text_perfiles = st_quill(value=st.session_state.text_perfiles, placeholder="Perfiles de Egreso", toolbar=toolbar, key=f"quill_perf_{ks}")
-    st.session_state.text_producto = st_quill(value=st.session_state.text_producto, placeholder="Producto Final", toolbar=toolbar, key=f"quill_prod_{ks}")
-
-with tab4:
+    set_plan_field("text_problematica", st_quill(value=st.session_state.text_problematica, placeholder="Problemática Contextual", toolbar=toolbar, key=quill_key("quill_prob", "text_problematica")))
+    set_plan_field("text_pda", st_quill(value=st.session_state.text_pda, placeholder="PDA", toolbar=toolbar, key=quill_key("quill_pda", "text_pda")))
+    set_plan_field("text_objetivos", st_quill(value=st.session_state.text_objetivos, placeholder="Objetivos", toolbar=toolbar, key=quill_key("quill_obj", "text_objetivos")))
+    set_plan_field("text_perfiles", st_quill(value=st.session_state.text_perfiles, placeholder="Perfiles de Egreso", toolbar=toolbar, key=quill_key("quill_perf", "text_perfiles")))
+    set_plan_field("text_producto", st_quill(value=st.session_state.text_producto, placeholder="Producto Final", toolbar=toolbar, key=quill_key("quill_prod", "text_producto")))
+
+TOOLBAR_SIMPLE = [['bold', 'italic', 'underline'], [{'list': 'bullet'}]]
+
+@st.fragment
+@profiled("tab4_sesion")
+@autosaved
+def render_daily_session(i, key_base):
+    day_data = st.session_state.daily_plan_data[key_base]
+    
+    with st.expander(f"Sesión {i+1}: {key_base}", expanded=True):
+        c1, c2, c3 = st.columns(3)
+        with c1: set_day_field(day_data, "inicio", st_quill(value=day_data["inicio"], placeholder="Inicio", key=quill_key(f"inicio_{key_base}", key_base), toolbar=TOOLBAR_SIMPLE))
+        with c2: set_day_field(day_data, "desarrollo", st_quill(value=day_data["desarrollo"], placeholder="Desarrollo", key=quill_key(f"desarrollo_{key_base}", key_base), toolbar=TOOLBAR_SIMPLE))
+        with c3: set_day_field(day_data, "cierre", st_quill(value=day_data["cierre"], placeholder="Cierre", key=quill_key(f"cierre_{key_base}", key_base), toolbar=TOOLBAR_SIMPLE))
+        
+        c4, c5 = st.columns(2)
+        with c4: set_day_field(day_data, "materiales", st_quill(value=day_data["materiales"], placeholder="Materiales", key=quill_key(f"mat_{key_base}", key_base), toolbar=TOOLBAR_SIMPLE))
+        with c5: 
+            set_day_field(day_data, "evaluacion", st_quill(value=day_data["evaluacion"], placeholder="Evaluación", key=quill_key(f"eval_{key_base}", key_base), toolbar=TOOLBAR_SIMPLE))
+            u_rubric = st.file_uploader("Rúbrica", type=["png", "jpg"], key=f"up_{key_base}")
+            if u_rubric:
+                set_day_field(day_data, "rubrica_path", store_rubric_upload(u_rubric))
+                st.success("Imagen cargada")
+
+def _mover_semana(paso, total):
+    st.session_state.tab4_semana = min(max(st.session_state.tab4_semana + paso, 0), total - 1)
+
+@st.fragment
+@profiled("tab4")
+@autosaved
+def render_tab4():
     st.subheader("Secuencia Didáctica")
-    toolbar_simple = [['bold', 'italic', 'underline'], [{'list': 'bullet'}]]
-    ks = st.session_state.quill_key_suffix
     
     if "ABPj" in st.session_state.plan_metodologia:
         st.markdown("### Aprendizaje Basado en Proyectos (ABPj)")
         
         col_abp1, col_abp2 = st.columns(2)
         with col_abp1:
-            st.session_state.abpj_presentacion = st_quill(value=st.session_state.abpj_presentacion, placeholder="1. Presentación", toolbar=toolbar_simple, key=f"q_abpj_1_{ks}")
-            st.session_state.abpj_formulacion = st_quill(value=st.session_state.abpj_formulacion, placeholder="3. Formulación del Problema", toolbar=toolbar_simple, key=f"q_abpj_3_{ks}")
-            st.session_state.abpj_experiencia = st_quill(value=st.session_state.abpj_experiencia, placeholder="5. Vivamos la Experiencia", toolbar=toolbar_simple, key=f"q_abpj_5_{ks}")
-            st.session_state.abpj_materiales = st_quill(value=st.session_state.abpj_materiales, placeholder="Materiales", toolbar=toolbar_simple, key=f"q_abpj_mat_{ks}")
+            set_plan_field("abpj_presentacion", st_quill(value=st.session_state.abpj_presentacion, placeholder="1. Presentación", toolbar=TOOLBAR_SIMPLE, key=quill_key("q_abpj_1", "abpj_presentacion")))
+            set_plan_field("abpj_formulacion", st_quill(value=st.session_state.abpj_formulacion, placeholder="3. Formulación del Problema", toolbar=TOOLBAR_SIMPLE, key=quill_key("q_abpj_3", "abpj_formulacion")))
+            set_plan_field("abpj_experiencia", st_quill(value=st.session_state.abpj_experiencia, placeholder="5. Vivamos la Experiencia", toolbar=TOOLBAR_SIMPLE, key=quill_key("q_abpj_5", "abpj_experiencia")))
+            set_plan_field("abpj_materiales", st_quill(value=st.session_state.abpj_materiales, placeholder="Materiales", toolbar=TOOLBAR_SIMPLE, key=quill_key("q_abpj_mat", "abpj_materiales")))
         
         with col_abp2:
-            st.session_state.abpj_recoleccion = st_quill(value=st.session_state.abpj_recoleccion, placeholder="2. Recolección", toolbar=toolbar_simple, key=f"q_abpj_2_{ks}")
-            st.session_state.abpj_organizacion = st_quill(value=st.session_state.abpj_organizacion, placeholder="4. Organización del Proyecto", toolbar=toolbar_simple, key=f"q_abpj_4_{ks}")
-            st.session_state.abpj_resultados = st_quill(value=st.session_state.abpj_resultados, placeholder="6. Resultados y Análisis", toolbar=toolbar_simple, key=f"q_abpj_6_{ks}")
+            set_plan_field("abpj_recoleccion", st_quill(value=st.session_state.abpj_recoleccion, placeholder="2. Recolección", toolbar=TOOLBAR_SIMPLE, key=quill_key("q_abpj_2", "abpj_recoleccion")))
+            set_plan_field("abpj_organizacion", st_quill(value=st.session_state.abpj_organizacion, placeholder="4. Organización del Proyecto", toolbar=TOOLBAR_SIMPLE, key=quill_key("q_abpj_4", "abpj_organizacion")))
+            set_plan_field("abpj_resultados", st_quill(value=st.session_state.abpj_resultados, placeholder="6. Resultados y Análisis", toolbar=TOOLBAR_SIMPLE, key=quill_key("q_abpj_6", "abpj_resultados")))
             
             st.markdown("#### Evaluación")
-            st.session_state.abpj_evaluacion = st_quill(value=st.session_state.abpj_evaluacion, placeholder="Evaluación", toolbar=toolbar_simple, key=f"q_abpj_eval_{ks}")
+            set_plan_field("abpj_evaluacion", st_quill(value=st.session_state.abpj_evaluacion, placeholder="Evaluación", toolbar=TOOLBAR_SIMPLE, key=quill_key("q_abpj_eval", "abpj_evaluacion")))
             uploaded_rubric = st.file_uploader("Anexar Rúbrica (Imagen)", type=["png", "jpg", "jpeg"], key="abpj_rubric_uploader")
             if uploaded_rubric:
-                temp_path = f"temp_rubric_abpj_{uploaded_rubric.name}"
-                with open(temp_path, "wb") as f:
-                    f.write(uploaded_rubric.getbuffer())
-                st.session_state.abpj_rubrica_path = os.path.abspath(temp_path)
+                set_plan_field("abpj_rubrica_path", store_rubric_upload(uploaded_rubric))
                 st.success(f"Rúbrica cargada: {uploaded_rubric.name}")
             
             if st.session_state.abpj_rubrica_path:
@@ -480,50 +579,55 @@ with tab4:
         start = st.session_state.plan_fecha_inicio
         end = st.session_state.plan_fecha_fin
         active_days = st.session_state.plan_dias
-        dias_map = {0: "Lunes", 1: "Martes", 2: "Miércoles", 3: "Jueves", 4: "Viernes"}
         
-        dias_generados = []
-        if start <= end:
-            delta = end - start
-            for i in range(delta.days + 1):
-                current = start + timedelta(days=i)
-                wd = current.weekday()
-                if wd in dias_map:
-                    dia_nombre = dias_map[wd]
-                    if dia_nombre in active_days:
-                        dias_generados.append((current, dia_nombre))
+        dias_generados = class_dates(start, end, active_days)
+        inhabiles = non_working_days_in_range(start, end, active_days)
+        if inhabiles:
+            st.caption("Días inhábiles del calendario oficial omitidos: " + ", ".join(
+                f"{d.strftime('%d/%m')}" + (f" ({desc})" if desc else "") for d, desc in inhabiles))
         
         if not dias_generados:
             st.warning("No hay días hábiles seleccionados en el rango de fechas.")
         else:
+            # Group sessions by school week; only the selected week's editors are mounted.
+            # Days outside it keep their entries in daily_plan_data untouched.
+            semanas = []
             for i, (fecha_obj, dia_nombre) in enumerate(dias_generados):
+                lunes = fecha_obj - timedelta(days=fecha_obj.weekday())
+                if not semanas or semanas[-1][0] != lunes:
+                    semanas.append((lunes, []))
+                semanas[-1][1].append((i, fecha_obj, dia_nombre))
+            
+            total = len(semanas)
+            if st.session_state.tab4_semana >= total:
+                st.session_state.tab4_semana = total - 1
+            
+            def semana_label(w):
+                sesiones = semanas[w][1]
+                return f"Semana {w+1} de {total}: {sesiones[0][1].strftime('%d/%m')} - {sesiones[-1][1].strftime('%d/%m/%Y')} ({len(sesiones)} sesiones)"
+            
+            c_prev, c_sel, c_next = st.columns([1, 4, 1], vertical_alignment="bottom")
+            with c_prev: st.button("◀ Anterior", on_click=_mover_semana, args=(-1, total), disabled=st.session_state.tab4_semana == 0, key="tab4_prev")
+            with c_sel: st.selectbox("Semana", list(range(total)), format_func=semana_label, key="tab4_semana")
+            with c_next: st.button("Siguiente ▶", on_click=_mover_semana, args=(1, total), disabled=st.session_state.tab4_semana == total - 1, key="tab4_next")
+            
+            for i, fecha_obj, dia_nombre in semanas[st.session_state.tab4_semana][1]:
                 fecha_str = fecha_obj.strftime("%d/%m/%Y")
                 key_base = f"{dia_nombre} {fecha_str}"
                 
                 if key_base not in st.session_state.daily_plan_data:
-                    st.session_state.daily_plan_data[key_base] = {
-                        "dia_nombre": key_base, "inicio": "", "desarrollo": "", "cierre": "",
-                        "materiales": "", "evaluacion": "", "rubrica_path": ""
-                    }
+                    st.session_state.daily_plan_data[key_base] = empty_day(key_base)
                 
-                day_data = st.session_state.daily_plan_data[key_base]
-                
-                with st.expander(f"Sesión {i+1}: {key_base}", expanded=True):
-                    c1, c2, c3 = st.columns(3)
-                    with c1: day_data["inicio"] = st_quill(value=day_data["inicio"], placeholder="Inicio", key=f"inicio_{key_base}_{ks}", toolbar=toolbar_simple)
-                    with c2: day_data["desarrollo"] = st_quill(value=day_data["desarrollo"], placeholder="Desarrollo", key=f"desarrollo_{key_base}_{ks}", toolbar=toolbar_simple)
-                    with c3: day_data["cierre"] = st_quill(value=day_data["cierre"], placeholder="Cierre", key=f"cierre_{key_base}_{ks}", toolbar=toolbar_simple)
-                    
-                    c4, c5 = st.columns(2)
-                    with c4: day_data["materiales"] = st_quill(value=day_data["materiales"], placeholder="Materiales", key=f"mat_{key_base}_{ks}", toolbar=toolbar_simple)
-                    with c5: 
-                        day_data["evaluacion"] = st_quill(value=day_data["evaluacion"], placeholder="Evaluación", key=f"eval_{key_base}_{ks}", toolbar=toolbar_simple)
-                        u_rubric = st.file_uploader("Rúbrica", type=["png", "jpg"], key=f"up_{key_base}")
-                        if u_rubric:
-                            t_path = f"temp_rubric_{i}_{u_rubric.name}"
-                            with open(t_path, "wb") as f: f.write(u_rubric.getbuffer())
-                            day_data["rubrica_path"] = os.path.abspath(t_path)
-                            st.success("Imagen cargada")
+                render_daily_session(i, key_base)
+
+with tab1:
+    render_tab1()
+with tab2:
+    render_tab2()
+with tab3:
+    render_tab3()
+with tab4:
+    render_tab4()
 
 # --- AI Prompt Generation ---
 st.markdown("---")
@@ -538,9 +642,6 @@ if st.button("✨ Generar Prompt IA"):
     disc = ", ".join([x for x in [p_data['disciplina1'], p_data['disciplina2'], p_data['disciplina3']] if x and "Seleccione" not in x])
     dias_txt = ", ".join(p_data['dias_planeados'])
     
-    # Clean HTML for prompt (basic strip)
-    def clean_html(t): return re.sub(r'<[^>]+>', '', t) if t else ""
-    
     prompt = f"Actúa como un docente experto de secundaria en México (SEP, Nueva Escuela Mexicana).\n\n"
     prompt += f"Genera una planeación didáctica para la materia de **{d['curso']['materia']}**.\n"
     prompt += f"- **Grado:** {grado} (Alumnos de aprox. {edad}).\n"
@@ -568,129 +669,98 @@ if st.button("✨ Generar Prompt IA"):
     st.info("Copia el texto de arriba y pégalo en tu IA favorita (ChatGPT, Gemini, DeepSeek).")
 
 # --- PDF Generation ---
-def generate_pdf_bytes():
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(letter), topMargin=0.5*inch, bottomMargin=0.5*inch, leftMargin=0.5*inch, rightMargin=0.5*inch)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    ruta_logo_imm = _get_full_path("LOGO imm.png")
-    ruta_logo_sep = _get_full_path("logo_sep.png")
-    
-    if os.path.exists(ruta_logo_imm):
-        logo_imm_rl = RLImage(ruta_logo_imm, width=1.5*inch, height=0.75*inch, kind='proportional')
-    else:
-        logo_imm_rl = Paragraph("[LOGO IMM]", styles['Normal'])
-        
-    if os.path.exists(ruta_logo_sep):
-        logo_sep_rl = RLImage(ruta_logo_sep, width=1.8*inch, height=0.75*inch, kind='proportional')
-    else:
-        logo_sep_rl = Paragraph("[LOGO SEP]", styles['Normal'])
-
-    header_paragraphs = [Paragraph(t, ParagraphStyle(name='HeaderCenter', alignment=TA_CENTER, fontName='Helvetica-Bold', fontSize=11, leading=14)) for t in ["Secretaría De Educación Pública", "Dirección De Educación Secundaria", "Instituto Mexicano Madero", "Planeaciones Docente"]]
-    
-    page_width = landscape(letter)[0] - 1*inch
-    col_widths_header = [2*inch, page_width - 4*inch, 2*inch]
-    header_data = [[logo_imm_rl, header_paragraphs, logo_sep_rl]]
-    header_table = Table(header_data, colWidths=col_widths_header)
-    header_table.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE'), ('ALIGN', (0, 0), (0, 0), 'LEFT'), ('ALIGN', (1, 0), (1, 0), 'CENTER'), ('ALIGN', (2, 0), (2, 0), 'RIGHT')]))
-    elements.append(header_table)
-    elements.append(Spacer(1, 0.2 * inch))
+def pdf_job_key(data):
+    """Key of the job for data in the selected mode (single PDF or per-group ZIP)."""
+    if st.session_state.pdf_por_grupo:
+        return bundle_hash(data, st.session_state.pdf_por_disciplina)
+    return plan_hash(data)
 
-    d = get_current_data()
-    p = d['planeacion']
-    
-    P = lambda x: Paragraph(html_to_reportlab(str(x)), styles['Normal'])
-    PB = lambda x: Paragraph(f"<b>{x}</b>", styles['Normal'])
-    
-    grupos_str = ", ".join(d['curso']['grupos'])
-    docente_name = f"{d['docente']['titulo']} {d['docente']['nombre']}"
-    dias_str = ", ".join(p['dias_planeados'])
-    
-    # Format dates for PDF
-    f_inicio = date.fromisoformat(p['fecha_inicio']).strftime("%d/%m/%Y")
-    f_fin = date.fromisoformat(p['fecha_fin']).strftime("%d/%m/%Y")
-    
-    temp_str = f"Del {f_inicio} al {f_fin}. Días: {dias_str}"
-    
-    ejes = ", ".join([e for e in [p['eje1'], p['eje2'], p['eje3']] if e and "Seleccione" not in e])
-    disc = ", ".join([x for x in [p['disciplina1'], p['disciplina2'], p['disciplina3']] if x and "Seleccione" not in x])
-
-    row0 = [[PB("Escuela:"), P("Instituto Mexicano Madero"), PB("CCT:"), P("21PES0013L"), PB("Docente:"), P(docente_name)]]
-    t0 = Table(row0, colWidths=[0.8*inch, 2.7*inch, 0.5*inch, 1*inch, 0.8*inch, 4.2*inch])
-    t0.setStyle(TableStyle([('VALIGN', (0,0), (-1,-1), 'TOP')]))
-    
-    row1 = [[PB("Grado:"), P(d['curso']['grado']), PB("Grupo:"), P(grupos_str), PB("Fase:"), P("6"), PB("Campo:"), P(d['curso']['campo'])]]
-    t1 = Table(row1, colWidths=[0.8*inch, 1.2*inch, 0.8*inch, 1.2*inch, 0.8*inch, 0.8*inch, 1.4*inch, 3*inch])
-    t1.setStyle(TableStyle([('VALIGN', (0,0), (-1,-1), 'TOP')]))
-
-    main_data = [
-        [t0], [t1],
-        [PB("Materia:"), P(d['curso']['materia'])], [PB("Metodología:"), P(p['metodologia'])],
-        [PB("Ejes:"), P(ejes)], [PB("Vinculación:"), P(disc)],
-        [PB("Problemática:"), P(p['problematica'])], [PB("PDA:"), P(p['pda'])],
-        [PB("Objetivos:"), P(p['objetivos'])], [PB("Perfiles:"), P(p['perfiles'])],
-        [PB("Temporalidad:"), P(temp_str)], [PB("Producto:"), P(p['producto'])]
-    ]
-    main_table = Table(main_data, colWidths=[2.0*inch, page_width - 2.0*inch])
-    main_table.setStyle(TableStyle([
-        ('GRID', (0,0), (-1,-1), 1, colors.black),
-        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-        ('SPAN', (0, 0), (1, 0)), ('SPAN', (0, 1), (1, 1))
-    ]))
-    elements.append(main_table)
-
-    if "ABPj" in p['metodologia']:
-        elements.append(PageBreak())
-        elements.append(Paragraph("Secuencia Didáctica (ABPj)", ParagraphStyle(name='H2', fontSize=12, fontName='Helvetica-Bold', alignment=TA_CENTER)))
-        abpj = p['secuencia_abpj']
-        seq_data = []
-        campos = [("Presentación", "presentacion"), ("Recolección", "recoleccion"), ("Formulación", "formulacion"), ("Organización", "organizacion"), ("Vivamos", "experiencia"), ("Resultados", "resultados"), ("Materiales", "materiales"), ("Evaluación", "evaluacion")]
-        
-        for label, key in campos:
-            content = [P(abpj.get(key, ""))]
-            if key == "evaluacion":
-                _embed_image_to_pdf(abpj.get("rubrica_path"), content, page_width - 2.0*inch)
-            seq_data.append([PB(label), content])
-        
-        st_table = Table(seq_data, colWidths=[2.0*inch, page_width - 2.0*inch])
-        st_table.setStyle(TableStyle([('GRID', (0,0), (-1,-1), 1, colors.black), ('VALIGN', (0,0), (-1,-1), 'TOP')]))
-        elements.append(st_table)
-    
-    elif p['metodologia'] != "Seleccione metodología":
-        elements.append(PageBreak())
-        elements.append(Paragraph("Secuencia Didáctica (Diaria)", ParagraphStyle(name='H2', fontSize=12, fontName='Helvetica-Bold', alignment=TA_CENTER)))
-        daily = p['secuencia_diaria']
-        for i, day in enumerate(daily):
-            elements.append(Paragraph(f"<b>{day['dia_nombre']}</b>", styles['Normal']))
-            eval_content = [P(day.get("evaluacion", ""))]
-            _embed_image_to_pdf(day.get("rubrica_path"), eval_content, page_width - 2.0*inch)
-            
-            d_data = [
-                [PB("Inicio"), P(day.get("inicio", ""))],
-                [PB("Desarrollo"), P(day.get("desarrollo", ""))],
-                [PB("Cierre"), P(day.get("cierre", ""))],
-                [PB("Materiales"), P(day.get("materiales", ""))],
-                [PB("Evaluación"), eval_content]
-            ]
-            dt = Table(d_data, colWidths=[2.0*inch, page_width - 2.0*inch])
-            dt.setStyle(TableStyle([('GRID', (0,0), (-1,-1), 1, colors.black), ('VALIGN', (0,0), (-1,-1), 'TOP')]))
-            elements.append(dt)
-            elements.append(Spacer(1, 0.1*inch))
-
-    elements.append(Spacer(1, 1.5*inch))
-    elements.append(Paragraph("_____________________________________________", ParagraphStyle(name='Firma', alignment=TA_CENTER)))
-    elements.append(Paragraph("Vo. Bo. Director David Pérez Ordoñez", ParagraphStyle(name='Firma', alignment=TA_CENTER)))
-
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+def pdf_job_version():
+    """
+    The plan version and output mode; the session's job is stale once this changes. Jobs are
+    shared by every session that asks for the same plan hash, so this is kept in the session.
+    """
+    return (st.session_state.plan_version, st.session_state.pdf_por_grupo, st.session_state.pdf_por_disciplina)
+
+def start_pdf_job():
+    data = get_current_data()
+    job = st.session_state.pdf_job
+    st.session_state.pdf_job_version = pdf_job_version()
+    if job is not None and job.key == pdf_job_key(data) and not job.cancelled():
+        if job.running() or job.future.exception() is None:
+            return # Same plan: keep the running build or its finished PDF
+    if job is not None:
+        job.cancel()
+    if st.session_state.pdf_por_grupo:
+        st.session_state.pdf_job = submit_bundle_job(data, st.session_state.pdf_por_disciplina)
+    else:
+        st.session_state.pdf_job = submit_pdf_job(data)
+
+@profiled("pdf_estado")
+def render_pdf_status(polling=False):
+    job = st.session_state.pdf_job
+    if st.session_state.pdf_job_version != pdf_job_version():
+        # The plan changed since the PDF was requested: stop the build and hide the stale download
+        job.cancel()
+        st.session_state.pdf_job = None
+        if polling:
+            st.toast("La planeación cambió; se canceló la generación del PDF.")
+            st.rerun()
+        return
+
+    if job.running():
+        st.progress(job.progress, text=f"Generando PDF ({job.phase}: {job.done}/{job.total})")
+        if st.button("Cancelar", key="pdf_cancel"):
+            job.cancel()
+            st.session_state.pdf_job = None
+            st.rerun()
+        return
+
+    if polling:
+        st.rerun() # Re-register the fragment without the polling timer
 
-st.markdown("### Generar Documento")
-if st.button("📄 Generar PDF"):
     try:
-        pdf_bytes = generate_pdf_bytes()
-        st.download_button(label="Descargar PDF", data=pdf_bytes, file_name="Planeacion.pdf", mime="application/pdf")
-        st.success("PDF Generado listo para descargar.")
+        pdf = job.result()
+        if job.key.startswith("zip-"):
+            download_file("Descargar PDFs (ZIP)", pdf, "Planeaciones_por_grupo.zip", "application/zip")
+            st.success("PDFs por grupo listos para descargar.")
+        else:
+            download_file("Descargar PDF", pdf, "Planeacion.pdf", "application/pdf")
+            st.success("PDF Generado listo para descargar.")
+    except PdfCancelled:
+        st.info("Generación de PDF cancelada.")
     except Exception as e:
         st.error(f"Error al generar PDF: {e}")
+
+st.markdown("### Generar Documento")
+c_pdf1, c_pdf2 = st.columns(2)
+with c_pdf1: st.toggle("Un PDF por grupo (ZIP)", key="pdf_por_grupo")
+with c_pdf2: st.toggle("Separar también por disciplina vinculada", key="pdf_por_disciplina", disabled=not st.session_state.pdf_por_grupo)
+if st.button("📄 Generar PDF"):
+    start_pdf_job()
+
+if st.session_state.pdf_job is not None:
+    running = st.session_state.pdf_job.running()
+    st.fragment(render_pdf_status, run_every=0.5 if running else None)(polling=running)
+
+with rerun_profiler.section(st.session_state, "autoguardado"):
+    autosave_tick()
+
+def render_profiler_panel():
+    """Debug panel with the session's latest rerun records; shown with ?perfil=1 when profiling is on."""
+    registros = rerun_profiler.history(st.session_state)
+    with st.sidebar.expander("Perfil de ejecución", expanded=True):
+        if not registros:
+            st.caption("Sin registros todavía.")
+            return
+        ultimo = registros[-1]
+        st.caption(f"Última ({ultimo['tipo']}): {ultimo['total_ms']:.1f} ms · {ultimo['widgets']} widgets · "
+                   f"{ultimo['estado_kb']:.0f} KB de estado · {ultimo['dias']} días")
+        secciones = sorted(ultimo["secciones_ms"].items(), key=lambda kv: -kv[1])
+        st.dataframe({"Sección": [k for k, _ in secciones], "ms": [v for _, v in secciones]}, hide_index=True)
+        st.dataframe([{k: r[k] for k in ("tipo", "total_ms", "widgets", "estado_kb", "dias")} for r in reversed(registros)], hide_index=True)
+        st.caption(f"Métricas en {rerun_profiler.METRICS_PATH}")
+
+rerun_profiler.finish(st.session_state)
+if rerun_profiler.ENABLED and st.query_params.get("perfil") == "1":
+    render_profiler_panel()
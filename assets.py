@@ -0,0 +1,122 @@
+"""
+Process-wide registry for the app's static images (logos and floating-button icons).
+
+Each asset path is resolved once. Encoded variants (PNG bytes pre-sized for the
+UI header, the floating buttons or the PDF header, and their base64 form) are
+cached and only rebuilt when the file's mtime changes; mtimes are re-checked at
+most every RECHECK_SECONDS, so reruns and PDF builds normally do no asset I/O.
+"""
+import base64
+import io
+import os
+import sys
+import threading
+import time
+
+try:
+    from PIL import Image
+except ImportError: # Pillow missing: variants fall back to the original file bytes
+    Image = None
+
+RECHECK_SECONDS = 5.0
+
+# Pixel boxes for each use (2x the CSS size on screen, 300 DPI in the PDF)
+ICON_PX = (120, 120)
+UI_LOGO_IMM_PX = (300, 300)
+UI_LOGO_SEP_PX = (360, 360)
+PDF_LOGO_IMM_PX = (450, 225) # 1.5 x 0.75 in
+PDF_LOGO_SEP_PX = (540, 225) # 1.8 x 0.75 in
+
+def _get_full_path(path):
+    """
+    Get the absolute path for a file, handling both script execution and PyInstaller (if used later).
+    Checks current directory first.
+    """
+    cwd_path = os.path.join(os.getcwd(), path)
+    if os.path.exists(cwd_path):
+        return cwd_path
+
+    alt_path = os.path.join(r"C:\Users\jaime\Documents\My planer", path)
+    if os.path.exists(alt_path):
+        return alt_path
+
+    try:
+        base = sys._MEIPASS
+    except AttributeError:
+        base = os.path.dirname(os.path.abspath(__file__))
+
+    full = os.path.join(base, path)
+    return full
+
+_lock = threading.Lock()
+_paths = {} # name -> resolved path
+_stamps = {} # name -> (mtime_ns or None, checked_at)
+_variants = {} # (name, box, encoding) -> (mtime_ns, value)
+
+def asset_path(name):
+    """Absolute path of an asset, resolved once per process."""
+    with _lock:
+        path = _paths.get(name)
+    if path is None:
+        path = _get_full_path(name)
+        with _lock:
+            _paths[name] = path
+    return path
+
+def asset_stamp(name):
+    """The asset's mtime_ns (None if missing), re-read from disk at most every RECHECK_SECONDS."""
+    now = time.monotonic()
+    with _lock:
+        cached = _stamps.get(name)
+    if cached is not None and now - cached[1] < RECHECK_SECONDS:
+        return cached[0]
+    try:
+        mtime = os.stat(asset_path(name)).st_mtime_ns
+    except OSError:
+        mtime = None
+    with _lock:
+        _stamps[name] = (mtime, now)
+    return mtime
+
+def _encode(path, box):
+    with open(path, "rb") as f:
+        data = f.read()
+    if box is None or Image is None:
+        return data
+    img = Image.open(io.BytesIO(data))
+    img.thumbnail(box)
+    out = io.BytesIO()
+    img.save(out, "PNG", optimize=True)
+    return out.getvalue()
+
+def image_bytes(name, box=None):
+    """
+    PNG bytes of an asset downscaled to fit box (width, height) in pixels,
+    or the original file bytes when box is None. Returns None if the file is missing.
+    """
+    return _variant(name, box, "bytes")
+
+def image_base64(name, box=None):
+    """Like image_bytes(), base64-encoded for data: URLs; "" if the file is missing."""
+    return _variant(name, box, "base64") or ""
+
+def _variant(name, box, encoding):
+    mtime = asset_stamp(name)
+    if mtime is None:
+        return None
+    key = (name, box, encoding)
+    with _lock:
+        cached = _variants.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    if encoding == "base64":
+        raw = image_bytes(name, box)
+        if raw is None:
+            return None
+        value = base64.b64encode(raw).decode()
+    else:
+        value = _encode(asset_path(name), box)
+    with _lock:
+        _variants[key] = (mtime, value)
+    return value
@@ -0,0 +1,187 @@
+"""
+Write-ahead autosave journal for plans being edited.
+
+Each journal is a snapshot file (the flattened plan fields, see
+plan_store.flatten_plan) plus an append-only log of field-level deltas. Edits
+are merged in memory and appended as one log line per DEBOUNCE_SECONDS; after
+COMPACT_EVERY lines the log is folded into a new snapshot. Restoring reads the
+snapshot and replays the log.
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from plan_store import flatten_plan, unflatten_plan
+
+AUTOSAVE_DIR = os.environ.get("PLANEADOR_AUTOSAVE_DIR", os.path.join(os.path.expanduser("~"), ".planeador", "autosave"))
+DEBOUNCE_SECONDS = 2.0
+COMPACT_EVERY = 200 # Log lines
+MAX_AGE_DAYS = 14
+MAX_OPEN_JOURNALS = 256 # Kept in memory across sessions
+
+_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+def new_journal_id():
+    return uuid.uuid4().hex
+
+def valid_journal_id(journal_id):
+    return bool(journal_id) and bool(_ID_RE.match(journal_id))
+
+class Journal:
+    """Autosave journal of one plan. Thread-safe; writes happen on a debounce timer."""
+    def __init__(self, journal_id, directory=AUTOSAVE_DIR):
+        self.id = journal_id
+        self.snap_path = os.path.join(directory, journal_id + ".snap.json")
+        self.log_path = os.path.join(directory, journal_id + ".log")
+        self._dir = directory
+        self._lock = threading.Lock()
+        self._fields = None # Fields as of the last record() call
+        self._pending = {} # path -> new value (None: removed), not yet on disk
+        self._log_lines = 0
+        self._timer = None
+
+    def exists(self):
+        return os.path.exists(self.snap_path)
+
+    def _read(self):
+        """(fields, log line count) from the snapshot plus every complete log line."""
+        try:
+            with open(self.snap_path, encoding="utf-8") as f:
+                fields = json.load(f)
+        except (OSError, ValueError):
+            return None, 0
+        lines = 0
+        try:
+            with open(self.log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        delta = json.loads(line)
+                    except ValueError:
+                        break # Torn last line from a crash mid-write
+                    for path, value in delta.items():
+                        if value is None:
+                            fields.pop(path, None)
+                        else:
+                            fields[path] = value
+                    lines += 1
+        except OSError:
+            pass
+        return fields, lines
+
+    def restore(self):
+        """The journaled plan dict, or None if there is no usable journal."""
+        with self._lock:
+            fields, self._log_lines = self._read()
+            if fields is None:
+                return None
+            self._fields = dict(fields)
+            self._pending.clear()
+        return unflatten_plan(fields)
+
+    def record(self, data):
+        """Notes the current plan dict; the changed fields reach disk within DEBOUNCE_SECONDS."""
+        fields = flatten_plan(data)
+        with self._lock:
+            if self._fields is None:
+                self._fields, self._log_lines = self._read()
+                self._fields = self._fields or {}
+            for path, value in fields.items():
+                if self._fields.get(path) != value:
+                    self._pending[path] = value
+            for path in self._fields.keys() - fields.keys():
+                self._pending[path] = None
+            self._fields = fields
+            if self._pending and self._timer is None:
+                self._timer = threading.Timer(DEBOUNCE_SECONDS, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Writes the pending deltas now (one appended line, or a snapshot when due)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            os.makedirs(self._dir, exist_ok=True)
+            if self._log_lines >= COMPACT_EVERY or not os.path.exists(self.snap_path):
+                self._compact()
+            else:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(self._pending, ensure_ascii=False, separators=(",", ":")) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._log_lines += 1
+            self._pending.clear()
+
+    def _compact(self):
+        # Snapshot first, then truncate the log: replaying a stale log over the new snapshot is harmless
+        tmp = self.snap_path + ".part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._fields, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snap_path)
+        open(self.log_path, "w").close()
+        self._log_lines = 0
+
+    def discard(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending.clear()
+            self._fields = None
+            for path in (self.snap_path, self.log_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+_lock = threading.Lock()
+_journals = OrderedDict() # journal id -> Journal, least recently used first
+_evicted = False
+
+def get_journal(journal_id):
+    """The process-wide Journal for journal_id (old journals are cleaned up on first use)."""
+    global _evicted
+    dropped = []
+    with _lock:
+        if not _evicted:
+            _evicted = True
+            evict()
+        journal = _journals.get(journal_id)
+        if journal is None:
+            journal = _journals[journal_id] = Journal(journal_id)
+            while len(_journals) > MAX_OPEN_JOURNALS:
+                dropped.append(_journals.popitem(last=False)[1])
+        else:
+            _journals.move_to_end(journal_id)
+    for old in dropped:
+        old.flush()
+    return journal
+
+def evict(max_age_days=MAX_AGE_DAYS):
+    """Deletes journal files untouched for max_age_days."""
+    if not os.path.isdir(AUTOSAVE_DIR):
+        return
+    cutoff = time.time() - max_age_days * 86400
+    for entry in os.scandir(AUTOSAVE_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+@atexit.register
+def flush_all():
+    with _lock:
+        journals = list(_journals.values())
+    for journal in journals:
+        journal.flush()
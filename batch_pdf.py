@@ -0,0 +1,90 @@
+"""
+Render a directory of saved plans (planeacion.json or .json.gz) to PDF in parallel.
+
+    python batch_pdf.py PLANES_DIR [-o SALIDA_DIR] [-j JOBS] [-r]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from plan_format import is_plan_file, plan_stem, read_plan
+from plan_pdf import render_plan_pdf
+
+def find_plan_files(src_dir, recursive=False):
+    """Returns the sorted list of plan files (.json, .json.gz) under src_dir."""
+    if recursive:
+        found = [os.path.join(root, f) for root, _, files in os.walk(src_dir) for f in files if is_plan_file(f)]
+    else:
+        found = [os.path.join(src_dir, f) for f in os.listdir(src_dir) if is_plan_file(f)]
+    return sorted(found)
+
+def _output_path(src_path, src_dir, out_dir):
+    rel = os.path.relpath(src_path, src_dir)
+    return os.path.join(out_dir, plan_stem(rel) + ".pdf")
+
+def render_file(src_path, dst_path):
+    """
+    Worker entry point: renders one JSON plan to dst_path.
+    Returns (src_path, seconds, error) where error is None on success.
+    """
+    t0 = time.perf_counter()
+    try:
+        data = read_plan(src_path)
+        pdf = render_plan_pdf(data)
+        os.makedirs(os.path.dirname(dst_path) or ".", exist_ok=True)
+        with open(dst_path, "wb") as f:
+            f.write(pdf)
+        return src_path, time.perf_counter() - t0, None
+    except Exception as e:
+        first_line = (str(e).splitlines() or [""])[0]
+        return src_path, time.perf_counter() - t0, f"{type(e).__name__}: {first_line}"
+
+def render_directory(src_dir, out_dir, jobs=None, recursive=False, log=print):
+    """
+    Renders every plan in src_dir across a process pool.
+    Returns a list of (src_path, seconds, error) tuples in completion order.
+    """
+    files = find_plan_files(src_dir, recursive)
+    results = []
+    if not files:
+        return results
+
+    jobs = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(jobs, len(files))) as pool:
+        futures = [pool.submit(render_file, f, _output_path(f, src_dir, out_dir)) for f in files]
+        for fut in as_completed(futures):
+            src, secs, error = fut.result()
+            results.append((src, secs, error))
+            status = "ERROR" if error else "ok"
+            log(f"{status:5} {secs:7.2f}s  {os.path.relpath(src, src_dir)}" + (f"  -> {error}" if error else ""))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera los PDF de un directorio de planeaciones (JSON).")
+    parser.add_argument("src_dir", help="Directorio con archivos planeacion.json (o .json.gz)")
+    parser.add_argument("-o", "--out", dest="out_dir", help="Directorio de salida (por defecto el mismo de entrada)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Procesos en paralelo (por defecto: núcleos disponibles)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Buscar planeaciones en subdirectorios")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.src_dir):
+        parser.error(f"No existe el directorio: {args.src_dir}")
+    out_dir = args.out_dir or args.src_dir
+
+    t0 = time.perf_counter()
+    results = render_directory(args.src_dir, out_dir, args.jobs, args.recursive)
+    wall = time.perf_counter() - t0
+
+    failed = [r for r in results if r[2]]
+    ok = len(results) - len(failed)
+    cpu = sum(r[1] for r in results)
+    rate = len(results) / wall if wall else 0.0
+    print(f"\n{ok} generados, {len(failed)} con error, {wall:.2f}s total ({rate:.1f} archivos/s, {cpu:.2f}s de render acumulado)")
+    for src, _, error in failed:
+        print(f"  {src}: {error}", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
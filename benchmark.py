@@ -0,0 +1,271 @@
+"""
+Benchmarks for the hot paths of the planner on synthetic plans: Quill HTML
+translation, get_current_data(), JSON serialization and PDF rendering.
+
+    python benchmark.py [-n PLANES] [--sesiones 10|100|500] [--html-kb KB] [--rubricas]
+                        [--modo abpj|diaria] [--guardar BASE.json] [--comparar BASE.json] [--escribir DIR]
+
+--sesiones sets the exact number of daily sessions of each plan (Monday to
+Friday from its start date); without it a plan has --semanas weeks of 3 or 5
+class days a week.
+
+Each stage runs over every generated plan --repeticiones times, keeping the best
+time, then once under tracemalloc for its peak memory, so the timings are not
+slowed down by the tracing. Caches
+are cleared before each stage: the figures are for plans the server has not seen.
+--guardar writes the results as a baseline; --comparar prints each stage against
+one and exits with 1 if any got slower (or bigger) than --tolerancia allows.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from plan_format import dumps_compact
+from plan_pdf import html_to_reportlab, render_plan_pdf, section_cache
+from plan_schema import empty_day, plan_json, plan_to_state, state_to_plan
+from plan_search import ABPJ_TEXT_FIELDS, DAY_TEXT_FIELDS, PLAN_TEXT_FIELDS
+from school_calendar import class_dates
+
+_WORDS = ("alumnos", "actividad", "proyecto", "comunidad", "análisis", "lectura", "equipo", "fracciones",
+          "ecosistema", "debate", "evidencia", "cuaderno", "exposición", "reflexión", "problema", "datos",
+          "gráfica", "texto", "investigación", "materiales", "rúbrica", "producto", "maqueta", "entrevista")
+_DIAS = ("Lunes", "Martes", "Miércoles", "Jueves", "Viernes")
+
+# --- Synthetic plans ---
+
+def _sentence(rng):
+    words = rng.choices(_WORDS, k=rng.randint(6, 16))
+    i = rng.randrange(len(words))
+    words[i] = rng.choice((f"<strong>{words[i]}</strong>", f"<em>{words[i]}</em>", f'<span style="font-weight: bold;">{words[i]}</span>'))
+    return " ".join(words).capitalize() + "."
+
+def synthetic_html(rng, size_kb):
+    """Quill-style HTML (paragraphs, lists, inline formatting) of about size_kb kilobytes."""
+    parts, size = [], 0
+    while size < size_kb * 1024:
+        if rng.random() < 0.2:
+            part = "<ol>" + "".join(f"<li>{_sentence(rng)}</li>" for _ in range(rng.randint(2, 5))) + "</ol>"
+        else:
+            part = "<p>" + " ".join(_sentence(rng) for _ in range(rng.randint(1, 4))) + "</p>"
+        parts.append(part)
+        size += len(part.encode("utf-8"))
+    return "".join(parts)
+
+def synthetic_image(path, rng, size=(1024, 768)):
+    """Writes a noisy JPEG, which compresses like a photo of a rubric."""
+    from PIL import Image
+    Image.frombytes("RGB", size, rng.randbytes(size[0] * size[1] * 3)).save(path, quality=85)
+    return path
+
+def _span(inicio, dias, sesiones):
+    """The end date of the sesiones-th class day from inicio."""
+    weeks = -(-sesiones // len(dias)) + 1
+    while True:
+        fechas = class_dates(inicio, inicio + timedelta(weeks=weeks), dias)
+        if len(fechas) >= sesiones:
+            return fechas[sesiones - 1][0]
+        weeks *= 2 # Holidays of the official calendar took some of them
+
+def synthetic_plan(rng, html_kb=1.0, abpj=False, semanas=2, rubrica=None, sesiones=None):
+    """
+    A plan dict in the structure of get_current_data(): every text field filled with
+    about html_kb KB of HTML, and a daily session for each class day of semanas weeks,
+    or for exactly sesiones class days (Monday to Friday) if given.
+    rubrica, an image path, is attached to the ABPj evaluation or to every day.
+    Materials and evaluation repeat across days, as they do in real plans.
+    """
+    inicio = date(2026, 8, 24) + timedelta(weeks=rng.randrange(30))
+    if sesiones:
+        dias = list(_DIAS)
+        fin = _span(inicio, dias, sesiones)
+    else:
+        fin = inicio + timedelta(weeks=semanas) - timedelta(days=3)
+        dias = list(_DIAS) if rng.random() < 0.5 else rng.sample(_DIAS, 3)
+    materiales, evaluacion = synthetic_html(rng, html_kb / 4), synthetic_html(rng, html_kb / 2)
+
+    state = {
+        "docente_titulo": "Mtra.", "docente_nombre": f"Docente {rng.randrange(1000)}",
+        "curso_grado": rng.choice(("1ro", "2do", "3ro")), "curso_grupos": sorted(rng.sample("ABCDEF", 2)),
+        "curso_materia": rng.choice(("Matematicas", "Español", "Historia", "Ciencias")), "curso_campo": "Lenguajes",
+        "plan_metodologia": "Aprendizaje Basado en Proyectos (ABPj)" if abpj else "STEAM",
+        "plan_fecha_inicio": inicio, "plan_fecha_fin": fin, "plan_dias": dias,
+        "plan_eje1": "Pensamiento Crítico", "plan_eje2": "Inclusión", "plan_eje3": "Seleccione eje",
+        "plan_disc1": "Ciencias", "plan_disc2": "Seleccione materia", "plan_disc3": "Seleccione materia",
+    }
+    for key, _ in PLAN_TEXT_FIELDS:
+        state[f"text_{key}"] = synthetic_html(rng, html_kb)
+    for key, _ in ABPJ_TEXT_FIELDS:
+        state[f"abpj_{key}"] = materiales if key == "materiales" else evaluacion if key == "evaluacion" else synthetic_html(rng, html_kb)
+    state["abpj_rubrica_path"] = rubrica if abpj else None
+
+    days = []
+    for current, dia_nombre in class_dates(inicio, fin, dias):
+        day = empty_day(f"{dia_nombre} {current.strftime('%d/%m/%Y')}").to_dict()
+        day.update(inicio=synthetic_html(rng, html_kb / 2), desarrollo=synthetic_html(rng, html_kb),
+                   cierre=synthetic_html(rng, html_kb / 2), materiales=materiales, evaluacion=evaluacion,
+                   rubrica_path=None if abpj else rubrica)
+        days.append(day)
+    return state_to_plan(state, days)
+
+def synthetic_plans(n, html_kb=1.0, abpj=False, semanas=2, rubricas=False, image_dir=None, seed=0, sesiones=None):
+    """n synthetic plans (see synthetic_plan); with rubricas, each gets its own image written to image_dir."""
+    rng = random.Random(seed)
+    plans = []
+    for i in range(n):
+        rubrica = synthetic_image(os.path.join(image_dir, f"rubrica_{i:04d}.jpg"), rng) if rubricas else None
+        plans.append(synthetic_plan(rng, html_kb, abpj, semanas, rubrica, sesiones))
+    return plans
+
+# --- Stages ---
+
+def _html_fields(data):
+    p = data["planeacion"]
+    yield from (p[key] for key, _ in PLAN_TEXT_FIELDS)
+    yield from (p["secuencia_abpj"][key] for key, _ in ABPJ_TEXT_FIELDS)
+    for day in p["secuencia_diaria"]:
+        yield from (day[key] for key, _ in DAY_TEXT_FIELDS)
+
+def _current_data(state):
+    # Same steps as get_current_data() in Planeador_st.py, on a plain dict
+    daily_sequence = []
+    for current, dia_nombre in class_dates(state["plan_fecha_inicio"], state["plan_fecha_fin"], state["plan_dias"]):
+        key = f"{dia_nombre} {current.strftime('%d/%m/%Y')}"
+        daily_sequence.append(state["daily_plan_data"].get(key) or empty_day(key))
+    return state_to_plan(state, daily_sequence)
+
+def _stages(plans):
+    """[(name, setup, run)]: setup() prepares the inputs outside the measurement, run(inputs) is measured."""
+    def html(_):
+        html_to_reportlab.cache_clear()
+        for data in plans:
+            for text in _html_fields(data):
+                html_to_reportlab(text)
+
+    def current_data(states):
+        for state in states:
+            _current_data(state)
+
+    def dumps(current):
+        for data in current:
+            plan_json(data, indent=4)
+
+    def compact(current):
+        for data in current:
+            dumps_compact(data)
+
+    def pdf(_):
+        section_cache.clear()
+        html_to_reportlab.cache_clear()
+        for data in plans:
+            render_plan_pdf(data)
+
+    none = lambda: None
+    current = lambda: [_current_data(plan_to_state(data)) for data in plans] # Saving serializes the session's own records
+    return [
+        ("html_to_reportlab", none, html),
+        ("get_current_data", lambda: [plan_to_state(data) for data in plans], current_data),
+        ("json_dumps", current, dumps),
+        ("dumps_compact", current, compact),
+        ("render_plan_pdf", none, pdf),
+    ]
+
+def run_benchmarks(plans, stages=None, repeat=3, log=print):
+    """{stage: {"segundos", "ms_por_plan", "pico_kb"}} for the selected stages (all by default)."""
+    render_plan_pdf(plans[0]) # Loads ReportLab and the template outside the measurements
+    results = {}
+    for name, setup, run in _stages(plans):
+        if stages and name not in stages:
+            continue
+        inputs = setup()
+        seconds = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            run(inputs)
+            seconds = min(seconds, time.perf_counter() - t0)
+
+        tracemalloc.start()
+        run(inputs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[name] = {"segundos": round(seconds, 4), "ms_por_plan": round(1000 * seconds / len(plans), 3), "pico_kb": round(peak / 1024, 1)}
+        log(f"{name:18} {seconds:8.3f}s  {results[name]['ms_por_plan']:9.3f} ms/plan  {results[name]['pico_kb']:10.1f} KB pico")
+    return results
+
+def compare(results, baseline, tolerance):
+    """Lines comparing results with a baseline's, and whether any stage regressed beyond tolerance (a fraction)."""
+    lines, regressed = [], False
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            lines.append(f"{name:18} (sin referencia)")
+            continue
+        flags = []
+        for metric in ("ms_por_plan", "pico_kb"):
+            if before[metric] and now[metric] > before[metric] * (1 + tolerance):
+                flags.append(metric)
+        regressed |= bool(flags)
+        dt = now["ms_por_plan"] / before["ms_por_plan"] - 1 if before["ms_por_plan"] else 0.0
+        dm = now["pico_kb"] / before["pico_kb"] - 1 if before["pico_kb"] else 0.0
+        lines.append(f"{name:18} tiempo {dt:+7.1%}  memoria {dm:+7.1%}" + (f"  REGRESIÓN ({', '.join(flags)})" if flags else ""))
+    return lines, regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el rendimiento de las rutas críticas con planeaciones sintéticas.")
+    parser.add_argument("-n", "--planes", type=int, default=10, help="Planeaciones a generar")
+    parser.add_argument("--sesiones", type=int, help="Sesiones diarias de cada planeación, p. ej. 10, 100 o 500 (por defecto, las de --semanas)")
+    parser.add_argument("--html-kb", type=float, default=1.0, help="Tamaño aproximado del HTML de cada campo, en KB")
+    parser.add_argument("--semanas", type=int, default=2, help="Semanas de sesiones diarias por planeación (sin --sesiones)")
+    parser.add_argument("--modo", choices=("diaria", "abpj"), default="diaria", help="Secuencia diaria o fases ABPj")
+    parser.add_argument("--rubricas", action="store_true", help="Adjuntar una imagen de rúbrica a cada planeación")
+    parser.add_argument("--etapas", nargs="+", help="Etapas a medir (por defecto todas)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Veces que se mide cada etapa; se conserva el mejor tiempo")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--guardar", metavar="BASE.json", help="Guardar los resultados como referencia")
+    parser.add_argument("--comparar", metavar="BASE.json", help="Comparar con una referencia guardada")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Aumento permitido frente a la referencia (0.2 = 20%%)")
+    parser.add_argument("--escribir", metavar="DIR", help="Solo escribir las planeaciones sintéticas en DIR, sin medir")
+    args = parser.parse_args(argv)
+    if args.sesiones is not None and args.sesiones < 1:
+        parser.error("--sesiones debe ser al menos 1")
+
+    config = {"planes": args.planes, "sesiones": args.sesiones, "html_kb": args.html_kb, "semanas": args.semanas, "modo": args.modo, "rubricas": args.rubricas, "semilla": args.semilla}
+    if args.escribir:
+        os.makedirs(args.escribir, exist_ok=True)
+        plans = synthetic_plans(args.planes, args.html_kb, args.modo == "abpj", args.semanas, args.rubricas, os.path.abspath(args.escribir), args.semilla, args.sesiones)
+        for i, data in enumerate(plans):
+            with open(os.path.join(args.escribir, f"planeacion_{i:04d}.json"), "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+        print(f"{len(plans)} planeaciones escritas en {args.escribir}")
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="planeador_bench_") as image_dir:
+        t0 = time.perf_counter()
+        plans = synthetic_plans(args.planes, args.html_kb, args.modo == "abpj", args.semanas, args.rubricas, image_dir, args.semilla, args.sesiones)
+        sesiones = sum(len(data["planeacion"]["secuencia_diaria"]) for data in plans)
+        print(f"{len(plans)} planeaciones, {sesiones} sesiones diarias generadas ({time.perf_counter() - t0:.2f}s)", file=sys.stderr)
+        results = run_benchmarks(plans, args.etapas, args.repeticiones)
+    status = 0
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"Aviso: la referencia se midió con otra configuración: {baseline.get('config')}", file=sys.stderr)
+        lines, regressed = compare(results, baseline.get("etapas", {}), args.tolerancia)
+        print("\nFrente a " + args.comparar + ":\n" + "\n".join(lines))
+        status = 1 if regressed else 0
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "python": platform.python_version(), "fecha": date.today().isoformat(), "etapas": results},
+                      f, indent=2, ensure_ascii=False)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
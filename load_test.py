@@ -0,0 +1,235 @@
+"""
+Load test: drives Planeador_st.py headlessly (Streamlit's AppTest) with N
+simultaneous simulated teachers and reports what it costs the server.
+
+    python load_test.py [PLANES ...] [-c 1 5 10 20 40] [--ediciones 6] [--pausa 1.0]
+
+Each session uploads a plan through the sidebar, edits Quill fields of
+"Contenido" and "Secuencia Didáctica" one rerun at a time, then presses
+"Generar PDF" and waits for the build. Without PLANES (planeacion.json or
+.json.gz files), synthetic plans from benchmark.py are used.
+
+For each concurrency level it prints rerun percentiles, PDF build latency
+(from the click to the finished file), throughput and the process RSS.
+AppTest is not thread-safe (it swaps a process-wide runtime in and out), so
+script runs take turns on a lock held for the whole run. The server has no
+such lock: its sessions' scripts interleave, slowed only by sharing the GIL.
+The time a run waits for its turn is therefore reported apart from the time
+the script itself takes; it is an artifact of this harness and, with many
+sessions, an upper bound of the server's queueing, not an estimate of it.
+PDF builds run on pdf_jobs' pool, concurrently with the reruns, as they do in
+production. AppTest runs the whole script on every interaction, so a rerun
+here is a full rerun, the upper bound of what a fragment rerun costs.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Planeador_st.py")
+TAB3_FIELDS = [("quill_prob", "text_problematica"), ("quill_pda", "text_pda"), ("quill_obj", "text_objetivos"),
+               ("quill_perf", "text_perfiles"), ("quill_prod", "text_producto")]
+ABPJ_FIELDS = [("q_abpj_1", "abpj_presentacion"), ("q_abpj_2", "abpj_recoleccion"), ("q_abpj_3", "abpj_formulacion"),
+               ("q_abpj_4", "abpj_organizacion"), ("q_abpj_5", "abpj_experiencia"), ("q_abpj_6", "abpj_resultados")]
+DAY_FIELDS = [("inicio", "inicio"), ("desarrollo", "desarrollo"), ("cierre", "cierre")]
+
+_app_lock = threading.Lock()
+
+def _rss_mb():
+    """Resident memory of this process in MB (Linux), else its peak where available, else None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+class _RssSampler(threading.Thread):
+    """Samples the RSS every interval seconds until stopped; keeps the peak."""
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _rss_mb()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            rss = _rss_mb()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.peak
+
+class SimulatedSession:
+    """One teacher: an AppTest of the app plus the timings of everything it did."""
+    def __init__(self, number, plan_bytes, edits, pause, timeout, seed):
+        from streamlit.testing.v1 import AppTest
+        self.number = number
+        self.plan_bytes = plan_bytes
+        self.edits = edits
+        self.pause = pause
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.reruns = [] # Seconds per script run, once it holds the lock
+        self.waits = [] # Seconds each run waited for the lock
+        self._started = None # When the last run was requested, before its wait
+        self.pdf_seconds = None
+        self.errors = []
+
+    def _run(self, action=None):
+        self._started = time.perf_counter()
+        with _app_lock:
+            t0 = time.perf_counter()
+            self.waits.append(t0 - self._started)
+            if action:
+                action()
+            self.at.run()
+            self.reruns.append(time.perf_counter() - t0)
+        if self.at.exception:
+            self.errors.append(self.at.exception[0].message)
+
+    def _think(self):
+        if self.pause:
+            time.sleep(self.rng.uniform(0, 2 * self.pause))
+
+    def _edit_targets(self):
+        state = self.at.session_state
+        rev = state["editor_rev"]
+        targets = [(f"{prefix}_{rev.get(field, 0)}", field, None) for prefix, field in TAB3_FIELDS]
+        if "ABPj" in state["plan_metodologia"]:
+            targets += [(f"{prefix}_{rev.get(field, 0)}", field, None) for prefix, field in ABPJ_FIELDS]
+        else:
+            days = list(state["daily_plan_data"])[:3] # First days: the week tab4 shows
+            targets += [(f"{prefix}_{day}_{rev.get(day, 0)}", field, day) for day in days for prefix, field in DAY_FIELDS]
+        return targets
+
+    def run(self):
+        try:
+            self._run()
+            self._run(lambda: self.at.sidebar.file_uploader[0].upload("planeacion.json", self.plan_bytes, "application/json"))
+            targets = self._edit_targets()
+            for i in range(self.edits):
+                self._think()
+                key, field, day = self.rng.choice(targets)
+                state = self.at.session_state
+                current = state["daily_plan_data"][day][field] if day else state[field]
+                def edit(key=key, value=f"{current}<p>Sesión {self.number}, edición {i + 1}.</p>"):
+                    self.at.session_state[key] = value
+                self._run(edit)
+
+            self._think()
+            self._run(lambda: next(b for b in self.at.button if b.label == "📄 Generar PDF").click())
+            t0 = self._started
+            job = self.at.session_state["pdf_job"]
+            job.future.result(timeout=self.timeout)
+            self.pdf_seconds = time.perf_counter() - t0
+            self._run() # The poll that shows the download
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+def _percentile(values, p):
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+def run_level(concurrency, plans, edits, pause, timeout, seed=0):
+    """Runs concurrency sessions at once; returns a dict of the level's measurements."""
+    sessions = [SimulatedSession(i, plans[i % len(plans)], edits, pause, timeout, seed + i) for i in range(concurrency)]
+    threads = [threading.Thread(target=s.run, name=f"sesion-{s.number}") for s in sessions]
+    sampler = _RssSampler()
+    sampler.start()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    peak = sampler.stop()
+
+    reruns = sorted(x for s in sessions for x in s.reruns)
+    waits = sorted(x for s in sessions for x in s.waits)
+    pdfs = sorted(s.pdf_seconds for s in sessions if s.pdf_seconds is not None)
+    return {
+        "sesiones": concurrency, "segundos": wall,
+        "reruns": len(reruns), "rerun_p50": _percentile(reruns, 50), "rerun_p90": _percentile(reruns, 90), "rerun_p99": _percentile(reruns, 99),
+        "espera_p50": _percentile(waits, 50), "espera_p90": _percentile(waits, 90), "espera_p99": _percentile(waits, 99),
+        "pdfs": len(pdfs), "pdf_p50": _percentile(pdfs, 50), "pdf_p90": _percentile(pdfs, 90),
+        "reruns_por_s": len(reruns) / wall, "pdfs_por_min": 60 * len(pdfs) / wall,
+        "rss_mb": _rss_mb(), "rss_pico_mb": peak,
+        "errores": [e for s in sessions for e in s.errors],
+    }
+
+def _load_plans(paths, args, image_dir):
+    if paths:
+        from plan_format import read_plan
+        return [json.dumps(read_plan(p), ensure_ascii=False).encode("utf-8") for p in paths]
+    from benchmark import synthetic_plans
+    plans = synthetic_plans(max(args.concurrencia), args.html_kb, args.modo == "abpj", rubricas=args.rubricas, image_dir=image_dir)
+    return [json.dumps(p, ensure_ascii=False).encode("utf-8") for p in plans]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga: sesiones simultáneas de la app sin navegador.")
+    parser.add_argument("planes", nargs="*", help="Planeaciones a cargar (por defecto, sintéticas)")
+    parser.add_argument("-c", "--concurrencia", type=int, nargs="+", default=[1, 5, 10, 20, 40], help="Sesiones simultáneas de cada nivel")
+    parser.add_argument("--ediciones", type=int, default=6, help="Ediciones de campos Quill por sesión antes de generar el PDF")
+    parser.add_argument("--pausa", type=float, default=1.0, help="Pausa media entre acciones de un docente, en segundos")
+    parser.add_argument("--timeout", type=float, default=300, help="Tiempo máximo de una ejecución del script o de un PDF")
+    parser.add_argument("--html-kb", type=float, default=1.0, help="Planeaciones sintéticas: tamaño del HTML de cada campo, en KB")
+    parser.add_argument("--modo", choices=("diaria", "abpj"), default="diaria", help="Planeaciones sintéticas: secuencia diaria o ABPj")
+    parser.add_argument("--rubricas", action="store_true", help="Planeaciones sintéticas: con imagen de rúbrica")
+    parser.add_argument("--json", metavar="SALIDA", help="Guardar también los resultados en un archivo JSON")
+    args = parser.parse_args(argv)
+
+    # Keep the simulated sessions' journals and repository out of the user's own
+    with tempfile.TemporaryDirectory(prefix="planeador_carga_", ignore_cleanup_errors=True) as scratch:
+        try:
+            return _main(args, scratch)
+        finally:
+            # Write pending journals now: autosave's own atexit flush would recreate the removed directory
+            from autosave import flush_all
+            flush_all()
+
+def _main(args, scratch):
+    os.environ.setdefault("PLANEADOR_AUTOSAVE_DIR", os.path.join(scratch, "autosave"))
+    os.environ.setdefault("PLANEADOR_DB", os.path.join(scratch, "planeaciones.db"))
+    os.environ.setdefault("PLANEADOR_INDICE", os.path.join(scratch, "indice.db"))
+
+    plans = _load_plans(args.planes, args, scratch)
+    print(f"Calentando ({len(plans)} planeaciones)...", file=sys.stderr)
+    run_level(1, plans, 1, 0, args.timeout) # Imports, template and caches outside the measurements
+
+    print(f"{'sesiones':>8} {'rerun p50':>10} {'p90':>8} {'p99':>8} {'espera p50':>11} {'p90':>8} {'p99':>8} {'PDF p50':>9} {'p90':>8} {'reruns/s':>9} {'PDF/min':>8} {'RSS MB':>8} {'pico':>8}")
+    results = []
+    for concurrency in args.concurrencia:
+        r = run_level(concurrency, plans, args.ediciones, args.pausa, args.timeout)
+        results.append(r)
+        print(f"{r['sesiones']:8d} {r['rerun_p50']:9.3f}s {r['rerun_p90']:7.3f}s {r['rerun_p99']:7.3f}s "
+              f"{r['espera_p50']:10.3f}s {r['espera_p90']:7.3f}s {r['espera_p99']:7.3f}s "
+              f"{r['pdf_p50']:8.2f}s {r['pdf_p90']:7.2f}s {r['reruns_por_s']:9.1f} {r['pdfs_por_min']:8.1f} "
+              f"{r['rss_mb'] or 0:8.0f} {r['rss_pico_mb'] or 0:8.0f}")
+        for error in sorted(set(r["errores"])):
+            print(f"    error: {error}", file=sys.stderr)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 1 if any(r["errores"] for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Per-group PDF bundles: one PDF per selected grupo (optionally one per grupo and
+linked disciplina), written into a ZIP as each one finishes.
+
+Variants differ only in the cells that name the grupo or disciplina, so every
+other section comes from section_cache. With a process pool each worker keeps
+its own cache, so the shared sections are built once per worker, not per file.
+"""
+import copy
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from plan_pdf import render_plan_pdf
+
+_UNSAFE_RE = re.compile(r'[^\w.-]+')
+_DISCIPLINAS = ("disciplina1", "disciplina2", "disciplina3")
+
+def _slug(text):
+    return _UNSAFE_RE.sub("_", str(text)).strip("_")
+
+def plan_variants(data, por_disciplina=False):
+    """
+    [(file name, plan dict)]: one variant per grupo of the plan, or per grupo and linked
+    disciplina if por_disciplina. A plan without grupos gives a single variant.
+    """
+    curso = data['curso']
+    p = data['planeacion']
+    stem = "_".join(_slug(x) for x in ("Planeacion", curso.get('materia'), curso.get('grado')) if x)
+    disciplinas = [p.get(k) for k in _DISCIPLINAS if p.get(k) and "Seleccione" not in p.get(k)]
+    grupos = curso.get('grupos') or [None]
+
+    variants = []
+    for grupo in grupos:
+        for disciplina in (disciplinas if por_disciplina and disciplinas else [None]):
+            variant = copy.deepcopy(data)
+            name = stem
+            if grupo is not None:
+                variant['curso']['grupos'] = [grupo]
+                name += f"_{_slug(grupo)}"
+            if disciplina is not None:
+                for i, key in enumerate(_DISCIPLINAS):
+                    variant['planeacion'][key] = disciplina if i == 0 else "Seleccione materia"
+                name += f"_{_slug(disciplina)}"
+            variants.append((name + ".pdf", variant))
+    return variants
+
+def render_variant(name, data):
+    """Worker entry point: (name, PDF bytes) of one variant."""
+    return name, render_plan_pdf(data)
+
+def write_bundle(variants, fileobj, executor=None, progress=None):
+    """
+    Renders variants (from plan_variants()) into a ZIP written to fileobj, one entry per
+    PDF in the order they finish. executor (e.g. a ProcessPoolExecutor) renders them in
+    parallel; without one they render here, one after another.
+    progress, if given, is called as progress("archivos", done, total) after each file;
+    raising from it cancels the files not yet started and aborts the bundle.
+    """
+    report = progress or (lambda phase, done, total: None)
+    total = len(variants)
+    report("archivos", 0, total)
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as zf:
+        if executor is None:
+            for done, (name, data) in enumerate(variants, 1):
+                zf.writestr(*render_variant(name, data))
+                report("archivos", done, total)
+            return
+
+        pending = {executor.submit(render_variant, name, data) for name, data in variants}
+        try:
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    zf.writestr(*future.result())
+                report("archivos", total - len(pending), total)
+        finally:
+            for future in pending:
+                future.cancel()
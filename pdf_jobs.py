@@ -0,0 +1,219 @@
+"""
+Background PDF generation: builds run on a small worker pool so the Streamlit
+script never blocks, report progress, can be cancelled, and finished PDFs are
+reused by plan hash. Per-group ZIP bundles (see pdf_bundle) and merged exports of
+repository plans (see term_export) are jobs too; their variants and plans render on
+a process pool started on first use.
+Unless pdf_spool is disabled, finished files are kept on disk and jobs return SpooledFile handles.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import pdf_spool
+import rerun_profiler
+from pdf_bundle import plan_variants, write_bundle
+from plan_pdf import _file_stamp, render_plan_pdf
+from plan_schema import plan_json
+from plan_store import get_store
+from term_export import export_term, repository_plans
+
+MAX_WORKERS = 2
+RENDER_PROCESSES = min(4, os.cpu_count() or 1) # Kept alive between bundles and exports, each with its own warm section cache
+MAX_RESULTS = 16 # Finished PDFs kept for reuse, across all sessions (on disk unless pdf_spool is disabled)
+
+class PdfCancelled(Exception):
+    """Raised inside a build whose job was cancelled."""
+
+def plan_hash(data):
+    """
+    Hash of a plan dict as returned by get_current_data(). Rubric images are
+    identified by path and file stamp, so replacing an image changes the hash.
+    """
+    p = data.get("planeacion", {})
+    rubricas = [p.get("secuencia_abpj", {}).get("rubrica_path")] + [day.get("rubrica_path") for day in p.get("secuencia_diaria", [])]
+    payload = plan_json([data, [_file_stamp(r) for r in rubricas]], sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+def bundle_hash(data, por_disciplina=False):
+    """Key of the per-group ZIP of a plan dict (see plan_hash)."""
+    return ("zip-disciplina-" if por_disciplina else "zip-") + plan_hash(data)
+
+def export_hash(rows):
+    """Key of the merged export of PlanStore.search() rows: their ids and save times."""
+    payload = json.dumps([[row["id"], row["updated_at"]] for row in rows])
+    return "periodo-" + hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+class PdfJob:
+    """A PDF build shared by every session that asked for the same plan hash."""
+    def __init__(self, key):
+        self.key = key
+        self.phase = "en cola"
+        self.done = 0
+        self.total = 0
+        self.future = Future()
+        self._watchers = 1
+        self._cancel_event = threading.Event()
+        self.phase_seconds = {} # phase -> seconds spent in it, for the metrics
+        self._phase_t0 = None
+
+    @property
+    def progress(self):
+        """
+        Overall completion in [0, 1]. For a single PDF building sections is the first half
+        and page layout the second; a bundle counts finished files, an export finished plans.
+        """
+        if self.future.done():
+            return 1.0
+        if not self.total:
+            return 0.0
+        fraction = min(self.done / self.total, 1.0)
+        if self.phase in ("archivos", "planes"):
+            return fraction
+        return 0.5 * fraction if self.phase == "secciones" else 0.5 + 0.5 * fraction
+
+    def running(self):
+        return not self.future.done()
+
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def result(self):
+        """
+        The finished PDF (or ZIP): a pdf_spool.SpooledFile, or bytes if spooling is disabled.
+        For an export, (that PDF, contents, errors) as returned by term_export.export_term().
+        Raises the build error, or PdfCancelled if the job was cancelled.
+        """
+        return self.future.result()
+
+    def cancel(self):
+        """Drops this session's interest; the build stops once no session is waiting for it."""
+        with _lock:
+            self._watchers -= 1
+            if self._watchers > 0 or self.future.done():
+                return
+            self._cancel_event.set()
+            if _running.get(self.key) is self:
+                del _running[self.key]
+
+    def _report(self, phase, done, total):
+        if self._cancel_event.is_set():
+            raise PdfCancelled()
+        if phase != self.phase:
+            self._close_phase()
+        self.phase, self.done, self.total = phase, done, total
+
+    def _close_phase(self):
+        now = time.perf_counter()
+        if self._phase_t0 is not None:
+            self.phase_seconds[self.phase] = self.phase_seconds.get(self.phase, 0.0) + now - self._phase_t0
+        self._phase_t0 = now
+
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="pdf")
+_render_pool = None
+_lock = threading.Lock()
+_running = {} # plan hash -> PdfJob
+_results = OrderedDict() # plan hash -> SpooledFile or PDF bytes
+
+def submit_pdf_job(data):
+    """
+    Starts (or joins) a background build for a plan dict and returns its PdfJob.
+    A plan that was already rendered returns a finished job immediately.
+    """
+    return _submit(plan_hash(data), _render_pdf, data)
+
+def submit_bundle_job(data, por_disciplina=False):
+    """Like submit_pdf_job(), for the ZIP with one PDF per grupo (and disciplina) of the plan."""
+    return _submit(bundle_hash(data, por_disciplina), _render_bundle, data, por_disciplina)
+
+def submit_export_job(rows):
+    """Like submit_pdf_job(), for one PDF with an index of the plans of PlanStore.search() rows."""
+    return _submit(export_hash(rows), _render_export, rows)
+
+def get_render_pool():
+    """The process pool that renders bundle variants and merged exports."""
+    global _render_pool
+    with _lock:
+        if _render_pool is None:
+            # spawn: forking the server would copy its threads' locks in whatever state they are in
+            _render_pool = ProcessPoolExecutor(max_workers=RENDER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _render_pool
+
+def _render_pdf(job, data):
+    if not pdf_spool.ENABLED:
+        return render_plan_pdf(data, progress=job._report)
+    return pdf_spool.spool("Planeacion.pdf", lambda f: render_plan_pdf(data, job._report, f))[0]
+
+def _render_bundle(job, data, por_disciplina):
+    def write(f):
+        write_bundle(plan_variants(data, por_disciplina), f, executor=get_render_pool(), progress=job._report)
+    if pdf_spool.ENABLED:
+        return pdf_spool.spool("Planeaciones_por_grupo.zip", write)[0]
+    buffer = io.BytesIO()
+    write(buffer)
+    return buffer.getvalue()
+
+def _render_export(job, rows):
+    def write(f):
+        return export_term(repository_plans(get_store(), rows), f, executor=get_render_pool(),
+                           window=2 * RENDER_PROCESSES, total=len(rows), progress=job._report)
+    if pdf_spool.ENABLED:
+        pdf, (contents, errors) = pdf_spool.spool("Planeaciones_periodo.pdf", write)
+        return pdf, contents, errors
+    buffer = io.BytesIO()
+    contents, errors = write(buffer)
+    return buffer.getvalue(), contents, errors
+
+def _submit(key, render, data, *args):
+    # Snapshot the plan: the UI keeps mutating the same records while the worker reads them
+    payload = plan_json(data)
+
+    with _lock:
+        if key in _results:
+            _results.move_to_end(key)
+            job = PdfJob(key)
+            job.future.set_result(_results[key])
+            return job
+
+        job = _running.get(key)
+        if job is not None:
+            job._watchers += 1
+            return job
+
+        job = PdfJob(key)
+        _running[key] = job
+
+    _pool.submit(_run_job, job, render, json.loads(payload), *args)
+    return job
+
+def _run_job(job, render, data, *args):
+    if job.cancelled():
+        job.future.set_exception(PdfCancelled())
+        return
+    started = time.time()
+    t0 = time.perf_counter()
+    try:
+        pdf = render(job, data, *args)
+    except BaseException as e:
+        job.future.set_exception(e)
+    else:
+        if rerun_profiler.ENABLED:
+            job._close_phase()
+            rerun_profiler.append_metrics({"ts": round(started, 3), "pid": os.getpid(), "tipo": job.key.split("-")[0] if "-" in job.key else "pdf",
+                                           "clave": job.key, "total_ms": round(1000 * (time.perf_counter() - t0), 2),
+                                           "fases_ms": {k: round(1000 * v, 2) for k, v in job.phase_seconds.items()}})
+        with _lock:
+            _results[job.key] = pdf
+            while len(_results) > MAX_RESULTS:
+                _results.popitem(last=False)
+        job.future.set_result(pdf)
+    finally:
+        with _lock:
+            if _running.get(job.key) is job:
+                del _running[job.key]
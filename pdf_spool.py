@@ -0,0 +1,88 @@
+"""
+Disk-backed downloads: finished PDFs and ZIPs are written to files under
+SPOOL_DIR instead of being kept as bytes, so a session holds a small handle
+whatever the size of its document (rubric photos make some of them large).
+
+Each file lives in its own directory with an unguessable name, so with
+server.enableStaticServing (see .streamlit/config.toml) Streamlit streams it from
+disk at SpooledFile.url under its real file name. A file is deleted once nothing
+holds its SpooledFile any more: the session that generated it ended or moved on
+to another PDF, and pdf_jobs dropped it from its finished-results cache. Files
+left behind by a server that did not exit cleanly are removed at the next start.
+"""
+import os
+import secrets
+import shutil
+import threading
+import time
+import weakref
+from urllib.parse import quote
+
+APP_STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static") # Served at app/static/
+SPOOL_DIR = os.path.abspath(os.environ.get("PLANEADOR_DESCARGAS_DIR", os.path.join(APP_STATIC_DIR, "descargas")))
+ENABLED = os.environ.get("PLANEADOR_PDF_EN_DISCO", "1") != "0" # 0 keeps finished PDFs in memory as bytes
+MAX_AGE = 12 * 3600 # Seconds after which a leftover file is swept at start-up
+
+class SpooledFile:
+    """A finished download on disk; the file is deleted when this object is garbage collected."""
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.dir = os.path.join(SPOOL_DIR, secrets.token_urlsafe(16))
+        self.path = os.path.join(self.dir, file_name)
+        os.makedirs(self.dir)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.dir, ignore_errors=True)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    @property
+    def url(self):
+        """Relative URL of the file under Streamlit's static serving, or None if SPOOL_DIR is not in static/."""
+        rel = os.path.relpath(self.path, APP_STATIC_DIR)
+        if rel.startswith(os.pardir):
+            return None
+        return "app/static/" + quote(rel.replace(os.sep, "/"))
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def remove(self):
+        self._finalizer()
+
+def spool(file_name, write):
+    """
+    Calls write(fileobj) to fill a new SpooledFile named file_name and returns
+    (SpooledFile, what write returned). The file only appears under its name once
+    complete; if write raises, nothing is left on disk.
+    """
+    _sweep_once()
+    result = SpooledFile(file_name)
+    partial = result.path + ".part"
+    try:
+        with open(partial, "wb") as f:
+            value = write(f)
+        os.replace(partial, result.path)
+    except BaseException:
+        result.remove()
+        raise
+    return result, value
+
+_swept = False
+_sweep_lock = threading.Lock()
+
+def _sweep_once():
+    global _swept
+    with _sweep_lock:
+        if _swept:
+            return
+        _swept = True
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        cutoff = time.time() - MAX_AGE
+        for entry in os.scandir(SPOOL_DIR):
+            try:
+                if entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                pass
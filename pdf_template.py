@@ -0,0 +1,337 @@
+"""
+ReportLab layout of the plan PDF.
+
+PlanPdfTemplate holds what every build shares (the stylesheet and paragraph
+styles, page geometry, table styles and the school header row) and is created
+once per process by get_template(). This is the only module that imports
+ReportLab; plan_pdf.render_plan_pdf() imports it on the first build, so the app
+does not load ReportLab until a PDF is actually generated.
+"""
+import copy
+import functools
+import hashlib
+import html
+import io
+import itertools
+import os
+import threading
+
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage, PageBreak, Flowable
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
+from reportlab.lib.utils import ImageReader
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.lib.units import inch
+from reportlab.lib import colors
+
+from assets import PDF_LOGO_IMM_PX, PDF_LOGO_SEP_PX, asset_stamp, image_bytes
+from plan_pdf import _chars_per_line, _copy_cells, _file_stamp, html_to_reportlab, parse_date, section_cache, split_markup
+
+class _MemoParagraph(Paragraph):
+    """
+    Paragraph that keeps its line breaking for the last width it was wrapped at.
+    Tables wrap each cell several times per build, and cached sections are wrapped again
+    on every rebuild; at a fixed column width the result is always the same. The memo
+    is a shared box, so the per-build copies of a cached cell (see _copy_cells) reuse it.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wrap_memo = [None]
+
+    def wrap(self, availWidth, availHeight):
+        memo = self._wrap_memo[0]
+        if memo is not None and memo[0] == availWidth:
+            _, self._wrapWidths, self.blPara, self.height = memo
+            self.width = availWidth
+            return availWidth, self.height
+        result = super().wrap(availWidth, availHeight)
+        if hasattr(self, "blPara"):
+            self._wrap_memo[0] = (availWidth, self._wrapWidths, self.blPara, self.height)
+        return result
+
+class _EncodedImage(Flowable):
+    """
+    Image drawn from a PDF image object encoded (compressed, alpha as a soft mask) once.
+    RLImage re-encodes the pixels on every build, which for the two header logos was
+    most of the time of a one-page plan. Sized like RLImage(kind='proportional').
+    Drawing goes through canvas and document internals (the version range in
+    requirements.txt is the one this was tested with).
+    """
+    def __init__(self, data, width, height):
+        Flowable.__init__(self)
+        reader = ImageReader(io.BytesIO(data))
+        image_width, image_height = reader.getSize()
+        factor = min(width / image_width, height / image_height)
+        self.drawWidth, self.drawHeight = image_width * factor, image_height * factor
+        self._image = PDFImageXObject(hashlib.blake2b(data, digest_size=16).hexdigest(), reader, mask='auto')
+        self._smask = self._image.__dict__.pop('_smask', None)
+
+    def wrap(self, availWidth, availHeight):
+        return self.drawWidth, self.drawHeight
+
+    def draw(self):
+        # Registered as in Canvas.drawImage(), but with shallow copies: a document stamps
+        # its own object name on what it registers, and the encoded stream is shared
+        canv = self.canv
+        doc = canv._doc
+        name = self._image.name
+        reg_name = doc.getXObjectName(name)
+        if reg_name not in doc.idToObject:
+            image = copy.copy(self._image)
+            if self._smask is not None:
+                image.smask = doc.Reference(copy.copy(self._smask), doc.getXObjectName(self._smask.name))
+            doc.addForm(name, image)
+        canv.saveState()
+        canv.scale(self.drawWidth, self.drawHeight)
+        canv._code.append(f"/{reg_name} Do")
+        canv.restoreState()
+        canv._formsinuse.append(name)
+        canv._currentPageHasImages = 1
+
+def _field_table(groups, col_widths, spanned=()):
+    """
+    Label/content table ruled like a GRID, except that a field's continuation rows
+    (from split_markup) have no line between them, so they read as one cell that
+    may continue on the next page. spanned rows go first, across both columns.
+    """
+    data = [[flowable, ""] for flowable in spanned]
+    cmds = [('BOX', (0,0), (-1,-1), 1, colors.black), ('VALIGN', (0,0), (-1,-1), 'TOP')]
+    for r in range(len(spanned)):
+        cmds.append(('SPAN', (0, r), (1, r)))
+        if r:
+            cmds.append(('LINEABOVE', (0, r), (-1, r), 1, colors.black))
+    for rows in groups:
+        r = len(data)
+        if r:
+            cmds.append(('LINEABOVE', (0, r), (-1, r), 1, colors.black))
+        cmds.append(('LINEAFTER', (0, r), (0, r + len(rows) - 1), 1, colors.black))
+        data.extend(rows)
+    return Table(data, colWidths=col_widths, style=TableStyle(cmds))
+
+ABPJ_CAMPOS = [("Presentación", "presentacion"), ("Recolección", "recoleccion"), ("Formulación", "formulacion"), ("Organización", "organizacion"), ("Vivamos", "experiencia"), ("Resultados", "resultados"), ("Materiales", "materiales"), ("Evaluación", "evaluacion")]
+HEADER_TITLES = ["Secretaría De Educación Pública", "Dirección De Educación Secundaria", "Instituto Mexicano Madero", "Planeaciones Docente"]
+
+class PlanPdfTemplate:
+    """
+    Styles, geometry and header shared by every plan PDF. Nothing here changes after
+    __init__ except the header row, which is rebuilt when a logo file changes.
+    Story-level flowables (titles, spacers, signatures) are still created per build:
+    ReportLab keeps page-break state on them, as it keeps layout state on cells, which
+    is why the cached ones are copied per build. Safe to share across threads.
+    """
+    page_size = landscape(letter)
+    margin = 0.5*inch
+
+    def __init__(self):
+        styles = getSampleStyleSheet()
+        self.normal = styles['Normal']
+        self.italic = styles['Italic']
+        self.header_center = ParagraphStyle(name='HeaderCenter', alignment=TA_CENTER, fontName='Helvetica-Bold', fontSize=11, leading=14)
+        self.h2 = ParagraphStyle(name='H2', fontSize=12, fontName='Helvetica-Bold', alignment=TA_CENTER)
+        self.firma = ParagraphStyle(name='Firma', alignment=TA_CENTER)
+        self.index_page = ParagraphStyle(name='IndexPage', parent=self.normal, alignment=TA_RIGHT)
+
+        self.page_width = self.page_size[0] - 2*self.margin
+        self.content_width = self.page_width - 2.0*inch
+        self.field_cols = [2.0*inch, self.content_width]
+        self.chars_per_line = _chars_per_line(self.content_width)
+        self.header_cols = [2*inch, self.page_width - 4*inch, 2*inch]
+        self.row0_cols = [0.8*inch, 2.7*inch, 0.5*inch, 1*inch, 0.8*inch, 4.2*inch]
+        self.row1_cols = [0.8*inch, 1.2*inch, 0.8*inch, 1.2*inch, 0.8*inch, 0.8*inch, 1.4*inch, 3*inch]
+
+        self.header_style = TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE'), ('ALIGN', (0, 0), (0, 0), 'LEFT'), ('ALIGN', (1, 0), (1, 0), 'CENTER'), ('ALIGN', (2, 0), (2, 0), 'RIGHT')])
+        self.top_style = TableStyle([('VALIGN', (0,0), (-1,-1), 'TOP')])
+        self.index_style = TableStyle([('VALIGN', (0,0), (-1,-1), 'TOP'), ('LINEBELOW', (0,0), (-1,-1), 0.5, colors.lightgrey)])
+        self._header_titles = [Paragraph(t, self.header_center) for t in HEADER_TITLES]
+        self._header = (None, None) # (logo stamps, header cell row)
+        self._header_lock = threading.Lock()
+
+    def P(self, x):
+        return _MemoParagraph(html_to_reportlab(str(x)), self.normal)
+
+    def PB(self, x):
+        return _MemoParagraph(f"<b>{x}</b>", self.normal)
+
+    def field(self, label, value, extra=None):
+        """Rows of one labelled field; content taller than CHUNK_LINES continues on extra rows."""
+        chunks = split_markup(html_to_reportlab(str(value)), self.chars_per_line)
+        rows = [[self.PB(label) if i == 0 else "", _MemoParagraph(chunk, self.normal)] for i, chunk in enumerate(chunks)]
+        if extra:
+            rows.append(["", extra]) # Rubric images get their own row so they never share one with a full chunk
+        return rows
+
+    def embed_image(self, path, content_list):
+        if path and os.path.exists(path):
+            try:
+                img = RLImage(path, width=self.content_width, height=4*inch, kind='proportional')
+                content_list.append(img)
+                content_list.append(Spacer(1, 0.1 * inch))
+            except Exception as e:
+                content_list.append(Paragraph(f"<i>[Error al cargar imagen: {os.path.basename(path)}]</i>", self.italic))
+
+    def header_row(self):
+        """The logos/titles row of the school header (a copy for one build), rebuilt only when a logo file changes."""
+        stamps = (asset_stamp("LOGO imm.png"), asset_stamp("logo_sep.png"))
+        with self._header_lock:
+            if self._header[0] == stamps:
+                return _copy_cells(self._header[1])
+
+            # Logos come pre-sized for print from the asset registry and are encoded here once
+            logo_imm = image_bytes("LOGO imm.png", PDF_LOGO_IMM_PX)
+            if logo_imm:
+                logo_imm_rl = _EncodedImage(logo_imm, 1.5*inch, 0.75*inch)
+            else:
+                logo_imm_rl = Paragraph("[LOGO IMM]", self.normal)
+
+            logo_sep = image_bytes("logo_sep.png", PDF_LOGO_SEP_PX)
+            if logo_sep:
+                logo_sep_rl = _EncodedImage(logo_sep, 1.8*inch, 0.75*inch)
+            else:
+                logo_sep_rl = Paragraph("[LOGO SEP]", self.normal)
+
+            row = [logo_imm_rl, self._header_titles, logo_sep_rl]
+            self._header = (stamps, row)
+            return _copy_cells(row)
+
+    def render(self, d, progress=None, fileobj=None):
+        """See plan_pdf.render_plan_pdf()."""
+        report = progress or (lambda phase, done, total: None)
+        buffer = io.BytesIO() if fileobj is None else fileobj
+        doc = SimpleDocTemplate(buffer, pagesize=self.page_size, topMargin=self.margin, bottomMargin=self.margin, leftMargin=self.margin, rightMargin=self.margin)
+        elements = []
+        P, PB, field = self.P, self.PB, self.field
+
+        elements.append(Table([self.header_row()], colWidths=self.header_cols, style=self.header_style))
+        elements.append(Spacer(1, 0.2 * inch))
+
+        p = d['planeacion']
+
+        if "ABPj" in p['metodologia']:
+            n_sections = 9
+        elif p['metodologia'] != "Seleccione metodología":
+            n_sections = 1 + len(p['secuencia_diaria'])
+        else:
+            n_sections = 1
+
+        grupos_str = ", ".join(d['curso']['grupos'])
+        docente_name = f"{d['docente']['titulo']} {d['docente']['nombre']}"
+        dias_str = ", ".join(p['dias_planeados'])
+
+        # Format dates for PDF
+        f_inicio = parse_date(p['fecha_inicio']).strftime("%d/%m/%Y")
+        f_fin = parse_date(p['fecha_fin']).strftime("%d/%m/%Y")
+
+        temp_str = f"Del {f_inicio} al {f_fin}. Días: {dias_str}"
+
+        ejes = ", ".join([e for e in [p['eje1'], p['eje2'], p['eje3']] if e and "Seleccione" not in e])
+        disc = ", ".join([x for x in [p['disciplina1'], p['disciplina2'], p['disciplina3']] if x and "Seleccione" not in x])
+
+        def build_main_rows():
+            row0 = [[PB("Escuela:"), P("Instituto Mexicano Madero"), PB("CCT:"), P("21PES0013L"), PB("Docente:"), P(docente_name)]]
+            row1 = [[PB("Grado:"), P(d['curso']['grado']), PB("Grupo:"), P(grupos_str), PB("Fase:"), P("6"), PB("Campo:"), P(d['curso']['campo'])]]
+            return row0, row1
+
+        row0, row1 = section_cache.get_or_build("main_rows", [docente_name, d['curso']['grado'], grupos_str, d['curso']['campo']], build_main_rows)
+        # One cache entry per field, so per-group and per-disciplina variants of a plan share all the others
+        main_fields = [
+            ("Materia:", d['curso']['materia']), ("Metodología:", p['metodologia']),
+            ("Ejes:", ejes), ("Vinculación:", disc),
+            ("Problemática:", p['problematica']), ("PDA:", p['pda']),
+            ("Objetivos:", p['objetivos']), ("Perfiles:", p['perfiles']),
+            ("Temporalidad:", temp_str), ("Producto:", p['producto'])
+        ]
+        groups = [section_cache.get_or_build("field", [label, value], functools.partial(field, label, value)) for label, value in main_fields]
+        t0 = Table(row0, colWidths=self.row0_cols, style=self.top_style)
+        t1 = Table(row1, colWidths=self.row1_cols, style=self.top_style)
+        elements.append(_field_table(groups, self.field_cols, spanned=[t0, t1]))
+        report("secciones", 1, n_sections)
+
+        if "ABPj" in p['metodologia']:
+            elements.append(PageBreak())
+            elements.append(Paragraph("Secuencia Didáctica (ABPj)", self.h2))
+            abpj = p['secuencia_abpj']
+            seq_data = []
+
+            for label, key in ABPJ_CAMPOS:
+                rubrica = abpj.get("rubrica_path") if key == "evaluacion" else None
+
+                def build_row(label=label, key=key, rubrica=rubrica):
+                    image = []
+                    if rubrica:
+                        self.embed_image(rubrica, image)
+                    return field(label, abpj.get(key, ""), image)
+
+                seq_data.append(section_cache.get_or_build("abpj_row", [label, abpj.get(key, ""), _file_stamp(rubrica)], build_row))
+                report("secciones", len(seq_data) + 1, n_sections)
+
+            elements.append(_field_table(seq_data, self.field_cols))
+
+        elif p['metodologia'] != "Seleccione metodología":
+            elements.append(PageBreak())
+            elements.append(Paragraph("Secuencia Didáctica (Diaria)", self.h2))
+            daily = p['secuencia_diaria']
+            for i, day in enumerate(daily):
+                def build_day(day=day):
+                    image = []
+                    self.embed_image(day.get("rubrica_path"), image)
+
+                    d_data = [
+                        field("Inicio", day.get("inicio", "")),
+                        field("Desarrollo", day.get("desarrollo", "")),
+                        field("Cierre", day.get("cierre", "")),
+                        field("Materiales", day.get("materiales", "")),
+                        field("Evaluación", day.get("evaluacion", ""), image)
+                    ]
+                    return d_data
+
+                day_inputs = [day['dia_nombre']] + [day.get(k, "") for k in ("inicio", "desarrollo", "cierre", "materiales", "evaluacion")] + [_file_stamp(day.get("rubrica_path"))]
+                d_data = section_cache.get_or_build("day", day_inputs, build_day)
+                # Story-level flowables carry page-break state (_postponed) from the build that laid them out, so only cell contents are cached
+                elements.append(Paragraph(f"<b>{day['dia_nombre']}</b>", self.normal))
+                elements.append(_field_table(d_data, self.field_cols))
+                elements.append(Spacer(1, 0.1*inch))
+                report("secciones", i + 2, n_sections)
+
+        elements.append(Spacer(1, 1.5*inch))
+        elements.append(Paragraph("_____________________________________________", self.firma))
+        elements.append(Paragraph("Vo. Bo. Director David Pérez Ordoñez", self.firma))
+
+        if progress is not None:
+            laid_out = itertools.count(1)
+            total = len(elements)
+            doc.afterFlowable = lambda flowable: progress("maquetacion", min(next(laid_out), total), total)
+
+        doc.build(elements)
+        return buffer.getvalue() if fileobj is None else None
+
+    def render_index(self, entries):
+        """
+        PDF bytes of the table of contents of a merged export. entries are (label, page number);
+        row i links to the URI "toc:<i>", which the merge turns into a jump to that page.
+        """
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=self.page_size, topMargin=self.margin, bottomMargin=self.margin, leftMargin=self.margin, rightMargin=self.margin)
+        rows = [[Paragraph(f'<a href="toc:{i}">{html.escape(label, quote=False)}</a>', self.normal), Paragraph(str(page), self.index_page)]
+                for i, (label, page) in enumerate(entries)]
+        elements = [
+            Table([self.header_row()], colWidths=self.header_cols, style=self.header_style),
+            Spacer(1, 0.2 * inch),
+            Paragraph("Índice", self.h2),
+            Spacer(1, 0.1 * inch),
+        ]
+        if rows:
+            elements.append(Table(rows, colWidths=[self.page_width - 1*inch, 1*inch], style=self.index_style))
+        doc.build(elements)
+        return buffer.getvalue()
+
+_template = None
+_template_lock = threading.Lock()
+
+def get_template():
+    """The process-wide PlanPdfTemplate, built on first use."""
+    global _template
+    with _template_lock:
+        if _template is None:
+            _template = PlanPdfTemplate()
+        return _template
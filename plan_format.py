@@ -0,0 +1,88 @@
+"""
+Plan file formats: the plain planeacion.json and a compact variant.
+
+The compact format stores every text that appears more than once (the same
+materials or evaluation on every day, repeated Quill markup) a single time in
+a table and refers to it by index, then gzips the JSON. read_plan()/loads_plan()
+accept either format, so existing planeacion.json files keep loading.
+"""
+import gzip
+import json
+from collections import Counter
+
+COMPACT_FORMAT = "planeador-compacto"
+COMPACT_VERSION = 1
+COMPACT_SUFFIX = ".json.gz"
+PLAN_SUFFIXES = (".json", COMPACT_SUFFIX)
+
+MIN_INTERN_LEN = 8 # Shorter repeated strings cost more as references than inline
+_REF = "\x00" # Interned-string references are "\x00<index>"; literals starting with it get it doubled
+
+def _count_strings(node, counts):
+    if isinstance(node, str):
+        counts[node] += 1
+    elif isinstance(node, dict) or hasattr(node, "to_dict"): # plan_schema.DaySession
+        for value in node.values():
+            _count_strings(value, counts)
+    elif isinstance(node, list):
+        for value in node:
+            _count_strings(value, counts)
+
+def _intern(node, index):
+    if isinstance(node, str):
+        ref = index.get(node)
+        if ref is not None:
+            return ref
+        return _REF + node if node.startswith(_REF) else node
+    if isinstance(node, dict) or hasattr(node, "to_dict"): # plan_schema.DaySession
+        return {k: _intern(v, index) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_intern(v, index) for v in node]
+    return node
+
+def _expand(node, table):
+    if isinstance(node, str):
+        if node.startswith(_REF):
+            return node[1:] if node.startswith(_REF, 1) else table[int(node[1:])]
+        return node
+    if isinstance(node, dict):
+        return {k: _expand(v, table) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_expand(v, table) for v in node]
+    return node
+
+def dumps_compact(data):
+    """The compact (interned, gzipped) encoding of a plan dict, as bytes."""
+    counts = Counter()
+    _count_strings(data, counts)
+    table = [s for s, n in counts.items() if n > 1 and len(s) >= MIN_INTERN_LEN]
+    index = {s: _REF + str(i) for i, s in enumerate(table)}
+    doc = {"formato": COMPACT_FORMAT, "version": COMPACT_VERSION, "textos": table, "plan": _intern(data, index)}
+    payload = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return gzip.compress(payload, compresslevel=9, mtime=0)
+
+def loads_plan(raw):
+    """A plan dict from file bytes in any supported format (plain or gzipped JSON, compact or not)."""
+    if raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+    doc = json.loads(raw.decode("utf-8-sig"))
+    if isinstance(doc, dict) and doc.get("formato") == COMPACT_FORMAT:
+        if doc.get("version", 1) > COMPACT_VERSION:
+            raise ValueError(f"Versión de formato compacto no soportada: {doc['version']}")
+        return _expand(doc["plan"], doc["textos"])
+    return doc
+
+def read_plan(path):
+    """Reads a plan file in any supported format."""
+    with open(path, "rb") as f:
+        return loads_plan(f.read())
+
+def is_plan_file(name):
+    return name.lower().endswith(PLAN_SUFFIXES)
+
+def plan_stem(path):
+    """path without its plan-file suffix (planeacion.json.gz -> planeacion)."""
+    for suffix in (COMPACT_SUFFIX, ".json"):
+        if path.lower().endswith(suffix):
+            return path[:-len(suffix)]
+    return path
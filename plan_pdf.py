@@ -0,0 +1,293 @@
+import copy
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+# --- Helper Functions ---
+
+def parse_date(date_str):
+    """Parses a date string trying ISO format first, then DD/MM/YYYY."""
+    if not date_str:
+        return date.today()
+    try:
+        return date.fromisoformat(date_str)
+    except ValueError:
+        try:
+            return datetime.strptime(date_str, "%d/%m/%Y").date()
+        except ValueError:
+            return date.today()
+
+# --- Quill HTML -> ReportLab markup ---
+
+_TAG_RE = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)([^>]*)>')
+_TAG_SPLIT_RE = re.compile(r'(</?[a-zA-Z][a-zA-Z0-9]*[^>]*>)') # Same tags as _TAG_RE, as one group for split()
+_HREF_RE = re.compile(r'href\s*=\s*"([^"]*)"', re.IGNORECASE)
+_STYLE_RE = re.compile(r'style\s*=\s*"([^"]*)"', re.IGNORECASE)
+
+# ReportLab markup for each tag name: (opening, closing). Tags not listed are dropped, keeping their text.
+# <br> is dropped because Quill writes empty lines as <p><br></p> and the </p> already breaks the line.
+_TAG_MAP = {
+    "b": ("<b>", "</b>"), "strong": ("<b>", "</b>"),
+    "i": ("<i>", "</i>"), "em": ("<i>", "</i>"),
+    "u": ("<u>", "</u>"),
+    "s": ("<strike>", "</strike>"), "strike": ("<strike>", "</strike>"),
+    "sub": ("<sub>", "</sub>"), "sup": ("<super>", "</super>"),
+    "p": ("", "<br/>"),
+    "li": ("<br/>• ", ""),
+}
+# Attribute-less tags (the bulk of Quill output) resolved with a single dict lookup
+_PLAIN_TAGS = {f"<{t}>": o for t, (o, _) in _TAG_MAP.items()} | {f"</{t}>": c for t, (_, c) in _TAG_MAP.items()}
+_CLOSE_SPAN = object()
+
+def _span_tags(attrs):
+    """Returns the ReportLab tags equivalent to the inline CSS of a Quill <span>."""
+    m = _STYLE_RE.search(attrs)
+    if not m:
+        return ()
+    style = m.group(1).replace(" ", "").lower()
+    tags = []
+    if "font-weight:bold" in style or "font-weight:700" in style:
+        tags.append("b")
+    if "font-style:italic" in style:
+        tags.append("i")
+    if "text-decoration:underline" in style:
+        tags.append("u")
+    return tags
+
+@functools.lru_cache(maxsize=1024)
+def _tag_markup(tag_text):
+    """
+    (markup, span close) for a tag _PLAIN_TAGS does not cover. span close is the markup
+    that ends an opening <span>, _CLOSE_SPAN for a closing one, else None. Quill repeats
+    the same few styled spans throughout a text, so each distinct tag is parsed once.
+    """
+    closing, tag, attrs = _TAG_RE.match(tag_text).groups()
+    tag = tag.lower()
+    if tag == "span":
+        if closing:
+            return "", _CLOSE_SPAN
+        tags = _span_tags(attrs)
+        return "".join(f"<{t}>" for t in tags), "".join(f"</{t}>" for t in reversed(tags))
+    mapped = _TAG_MAP.get(tag)
+    if mapped is not None:
+        return mapped[1] if closing else mapped[0], None
+    if tag == "a":
+        if closing:
+            return "</a>", None
+        href = _HREF_RE.search(attrs)
+        return f'<a href="{href.group(1)}">' if href else "<a>", None
+    return "", None
+
+@functools.lru_cache(maxsize=512)
+def html_to_reportlab(html_text):
+    """
+    Convert Quill HTML to ReportLab XML tags.
+    Splits the text at its tags once and translates the tags in bulk (plain tags by dict
+    lookup); spans are kept on a stack so nested spans close correctly.
+    Results are cached since the same materials/evaluation text repeats across days.
+    """
+    if not html_text:
+        return ""
+
+    parts = _TAG_SPLIT_RE.split(html_text) # Text at even indices, tags at odd ones
+    tags = parts[1::2]
+    markup = list(map(_PLAIN_TAGS.get, tags))
+    if None in markup:
+        span_stack = []
+        for i, m in enumerate(markup):
+            if m is None:
+                m, span_close = _tag_markup(tags[i])
+                if span_close is _CLOSE_SPAN:
+                    m = span_stack.pop() if span_stack else ""
+                elif span_close is not None:
+                    span_stack.append(span_close)
+                markup[i] = m
+    parts[1::2] = markup
+    text = "".join(parts)
+
+    # Clean up initial <br/> if any
+    if text.startswith("<br/>"):
+        text = text[5:]
+
+    return text
+
+# --- Long content ---
+
+# A table row cannot split across pages, so content taller than a page would raise LayoutError.
+# Field content is cut into chunks of at most CHUNK_LINES estimated lines, one table row each.
+CHUNK_LINES = 25 # ~300pt of 10pt text, well under the 540pt landscape frame
+_MARKUP_TOKEN_RE = re.compile(r'(<[^>]+>)')
+_MARKUP_TAG_RE = re.compile(r'<(/?)(\w+)')
+
+def _chars_per_line(width, font_size=10):
+    # Deliberately low (wide average glyph) so the line estimate errs towards smaller chunks
+    return max(int(width / (font_size * 0.55)), 1)
+
+def _word_cut(token, cut):
+    """cut, moved back to before an entity (&amp;) it would split."""
+    amp = token.rfind("&", max(cut - 8, 0), cut)
+    if amp < 0 or token.find(";", amp, cut) >= 0:
+        return cut
+    return amp if amp > 0 else token.find(";", amp) + 1 or cut
+
+def split_markup(markup, chars_per_line, max_lines=CHUNK_LINES):
+    """
+    Splits ReportLab markup into chunks of at most max_lines estimated lines, in one pass.
+    Chunks break at line breaks, or at spaces inside a long paragraph; a word longer than
+    a whole chunk (a pasted URL or base64 text) is cut. Inline tags still open at a break
+    are closed at the end of the chunk and reopened at the start of the next.
+    """
+    if len(markup) <= chars_per_line * max_lines and markup.count("<br/>") < max_lines:
+        return [markup]
+
+    chunks = []
+    current = []
+    open_tags = [] # (name, opening tag) of the inline tags open at this point
+    lines = 0 # Finished lines in the current chunk
+    col = 0 # Characters in the current line
+
+    def flush():
+        nonlocal current, lines
+        chunks.append("".join(current) + "".join(f"</{name}>" for name, _ in reversed(open_tags)))
+        current = [tag for _, tag in open_tags]
+        lines = 0
+
+    for token in _MARKUP_TOKEN_RE.split(markup):
+        if not token:
+            continue
+        if token.startswith("<"):
+            if token == "<br/>":
+                lines += max(1, -(-col // chars_per_line))
+                col = 0
+                if lines >= max_lines:
+                    flush() # The break between rows replaces this one
+                else:
+                    current.append(token)
+                continue
+            current.append(token)
+            m = _MARKUP_TAG_RE.match(token)
+            if m and not token.endswith("/>"):
+                if m.group(1):
+                    if open_tags and open_tags[-1][0] == m.group(2):
+                        open_tags.pop()
+                else:
+                    open_tags.append((m.group(2), token))
+            continue
+
+        while lines + (col + len(token)) // chars_per_line >= max_lines:
+            room = (max_lines - lines) * chars_per_line - col
+            cut = token.rfind(" ", 0, max(room, 1))
+            if cut <= 0:
+                if current and (lines or col):
+                    col = 0
+                    flush()
+                    continue
+                cut = _word_cut(token, max(room, chars_per_line)) # No space in a whole chunk
+                current.append(token[:cut])
+                token = token[cut:]
+            else:
+                current.append(token[:cut])
+                token = token[cut + 1:]
+            col = 0
+            flush()
+        current.append(token)
+        col += len(token)
+
+    if any(not t.startswith("<") for t in current):
+        flush()
+    return chunks or [markup]
+
+# --- Section Cache ---
+
+class FlowableCache:
+    """
+    Process-wide LRU of built cell flowables, keyed by a hash of the content they were built from.
+    Bounded by entry count and by the total size of that content, so it stays small on a shared server.
+    Layout still runs for the whole document on every build; what is reused is HTML translation,
+    paragraph parsing and image loading, which dominate build time. Tables keep split/layout state
+    between builds, so callers cache the cell rows and wrap them in a new Table each time.
+    Layout also sets per-build state (canv, wrap and split results) on the cells themselves, so
+    the cached cells are never laid out: every call returns shallow copies (see _copy_cells).
+    """
+    def __init__(self, max_entries=2048, max_chars=4_000_000):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries = OrderedDict()  # key -> (flowables, cost)
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, kind, inputs, build):
+        payload = json.dumps([kind, inputs], ensure_ascii=False, sort_keys=True, default=str)
+        key = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy_cells(entry[0])
+            self.misses += 1
+
+        flowables = build()
+        cost = len(payload)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (flowables, cost)
+                self._chars += cost
+            while self._entries and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+                _, (_, old_cost) = self._entries.popitem(last=False)
+                self._chars -= old_cost
+        return _copy_cells(flowables)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chars = 0
+
+section_cache = FlowableCache()
+
+def _copy_cells(cells):
+    """
+    Copy of nested lists/tuples of flowables for one build: each flowable is copied
+    shallowly, so what ReportLab sets on it while laying out one document stays off
+    the original. The parsed content they share is only read during layout.
+    """
+    if isinstance(cells, (list, tuple)):
+        return type(cells)(_copy_cells(c) for c in cells)
+    if isinstance(cells, str):
+        return cells
+    return copy.copy(cells)
+
+def _file_stamp(path):
+    """Identifies a file's current contents for cache keys, so re-uploads under the same name invalidate."""
+    if path and os.path.exists(path):
+        st = os.stat(path)
+        return [path, st.st_mtime_ns, st.st_size]
+    return None
+
+# --- PDF Generation ---
+
+def render_plan_pdf(d, progress=None, fileobj=None):
+    """
+    Render a plan dict (the structure produced by get_current_data() and saved
+    as planeacion.json) to PDF bytes, or into fileobj if given (returning None).
+    Has no dependency on Streamlit, so it can run from the batch CLI or a worker process.
+    Sections whose content did not change since an earlier build come from section_cache.
+    progress, if given, is called as progress(phase, done, total) after each section is
+    built ("secciones") and each flowable is laid out ("maquetacion"); raising from it aborts the build.
+    """
+    from pdf_template import get_template # Loads ReportLab on the first build only
+    from rubric_store import refresh_plan_rubrics
+    refresh_plan_rubrics(d) # Before the cache keys read the files' mtimes
+    return get_template().render(d, progress, fileobj)
+
+def render_index_pdf(entries):
+    """Table-of-contents PDF for a merged export; see PlanPdfTemplate.render_index()."""
+    from pdf_template import get_template
+    return get_template().render_index(entries)
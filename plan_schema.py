@@ -0,0 +1,185 @@
+"""
+Mapping between a saved plan (docente / curso / planeacion JSON) and the app's
+session-state keys, so loading, saving and the state defaults share one table.
+Daily sessions are DaySession records, in daily_plan_data and in the plan dicts
+built from the state alike; plan_json() writes them out without copying the plan.
+"""
+import copy
+import json
+from datetime import date
+
+from plan_pdf import parse_date
+
+# (state key, path in the plan JSON, default), in the order the JSON is written
+PLAN_FIELDS = [
+    ("docente_titulo", ("docente", "titulo"), "Dr."),
+    ("docente_nombre", ("docente", "nombre"), ""),
+    ("curso_grado", ("curso", "grado"), "1ro"),
+    ("curso_grupos", ("curso", "grupos"), []),
+    ("curso_materia", ("curso", "materia"), "Matematicas"),
+    ("curso_campo", ("curso", "campo"), "Lenguajes"),
+    ("plan_metodologia", ("planeacion", "metodologia"), "Seleccione metodología"),
+    ("plan_fecha_inicio", ("planeacion", "fecha_inicio"), None), # Dates default to today
+    ("plan_fecha_fin", ("planeacion", "fecha_fin"), None),
+    ("plan_dias", ("planeacion", "dias_planeados"), []),
+    ("text_problematica", ("planeacion", "problematica"), ""),
+    ("text_pda", ("planeacion", "pda"), ""),
+    ("text_objetivos", ("planeacion", "objetivos"), ""),
+    ("text_perfiles", ("planeacion", "perfiles"), ""),
+    ("text_producto", ("planeacion", "producto"), ""),
+    ("plan_eje1", ("planeacion", "eje1"), "Seleccione eje"),
+    ("plan_eje2", ("planeacion", "eje2"), "Seleccione eje"),
+    ("plan_eje3", ("planeacion", "eje3"), "Seleccione eje"),
+    ("plan_disc1", ("planeacion", "disciplina1"), "Seleccione materia"),
+    ("plan_disc2", ("planeacion", "disciplina2"), "Seleccione materia"),
+    ("plan_disc3", ("planeacion", "disciplina3"), "Seleccione materia"),
+    ("abpj_presentacion", ("planeacion", "secuencia_abpj", "presentacion"), ""),
+    ("abpj_recoleccion", ("planeacion", "secuencia_abpj", "recoleccion"), ""),
+    ("abpj_formulacion", ("planeacion", "secuencia_abpj", "formulacion"), ""),
+    ("abpj_organizacion", ("planeacion", "secuencia_abpj", "organizacion"), ""),
+    ("abpj_experiencia", ("planeacion", "secuencia_abpj", "experiencia"), ""),
+    ("abpj_resultados", ("planeacion", "secuencia_abpj", "resultados"), ""),
+    ("abpj_materiales", ("planeacion", "secuencia_abpj", "materiales"), ""),
+    ("abpj_evaluacion", ("planeacion", "secuencia_abpj", "evaluacion"), ""),
+    ("abpj_rubrica_path", ("planeacion", "secuencia_abpj", "rubrica_path"), None),
+]
+DATE_FIELDS = {"plan_fecha_inicio", "plan_fecha_fin"}
+
+# Fields of each secuencia_diaria entry, besides its "dia_nombre" key
+DAY_FIELDS = ("inicio", "desarrollo", "cierre", "materiales", "evaluacion", "rubrica_path")
+
+_DAY_KEYS = ("dia_nombre",) + DAY_FIELDS
+
+class DaySession:
+    """
+    One daily session (an entry of secuencia_diaria). A long plan keeps hundreds of
+    them per session, so they are slotted records rather than dicts: the field names
+    live once in the class instead of in every entry. They support the dict operations
+    the app and the PDF template use (day[field], get(), items()); keys other than
+    _DAY_KEYS in a loaded entry are dropped.
+    """
+    __slots__ = _DAY_KEYS
+
+    def __init__(self, dia_nombre, **fields):
+        self.dia_nombre = dia_nombre
+        for field in DAY_FIELDS:
+            setattr(self, field, fields.get(field, ""))
+
+    @classmethod
+    def from_dict(cls, item, strings=None):
+        """
+        The record for a secuencia_diaria entry. With a strings dict, equal texts share one
+        object across the records built with it (materials or evaluation repeated on every day).
+        """
+        fields = {k: item[k] for k in _DAY_KEYS if k in item}
+        if strings is not None:
+            fields = {k: strings.setdefault(v, v) if isinstance(v, str) else v for k, v in fields.items()}
+        return cls(**fields)
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in _DAY_KEYS}
+
+    def __getitem__(self, field):
+        if field not in _DAY_KEYS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        if field not in _DAY_KEYS:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in _DAY_KEYS else default
+
+    def keys(self):
+        return _DAY_KEYS
+
+    def values(self):
+        return (getattr(self, k) for k in _DAY_KEYS)
+
+    def items(self):
+        return ((k, getattr(self, k)) for k in _DAY_KEYS)
+
+    def __iter__(self):
+        return iter(_DAY_KEYS)
+
+    def __eq__(self, other):
+        if not isinstance(other, DaySession):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in _DAY_KEYS)
+
+    def __repr__(self):
+        return f"DaySession({self.to_dict()!r})"
+
+def json_default(obj):
+    """json.dumps() default for plan dicts: DaySession records as objects, anything else (dates) as str."""
+    to_dict = getattr(obj, "to_dict", None) # Duck-typed: Streamlit re-imports this module when it changes
+    return to_dict() if to_dict is not None else str(obj)
+
+def plan_json(data, **kwargs):
+    """
+    json.dumps() of a plan dict as built by state_to_plan(), straight from the session's
+    own records: each day is turned into a dict only while it is being written.
+    """
+    return json.dumps(data, default=json_default, ensure_ascii=False, **kwargs)
+
+def state_defaults():
+    """Fresh default values for every plan state key (plus an empty daily_plan_data)."""
+    defaults = {}
+    for key, _, default in PLAN_FIELDS:
+        defaults[key] = date.today() if key in DATE_FIELDS else copy.copy(default)
+    defaults["daily_plan_data"] = {}
+    return defaults
+
+def empty_day(dia_nombre):
+    return DaySession(dia_nombre)
+
+def plan_to_state(data):
+    """
+    State values for a loaded plan dict: {state key: value}, with daily_plan_data
+    holding a DaySession per dia_nombre. Missing entries take their defaults.
+    """
+    state = {}
+    for key, path, default in PLAN_FIELDS:
+        node = data
+        for part in path:
+            node = node.get(part) if isinstance(node, dict) else None
+        if key in DATE_FIELDS:
+            state[key] = parse_date(node)
+        else:
+            state[key] = copy.copy(default) if node is None else node
+
+    days = data.get("planeacion", {}).get("secuencia_diaria", [])
+    strings = {}
+    state["daily_plan_data"] = {item["dia_nombre"]: DaySession.from_dict(item, strings) for item in days}
+    return state
+
+def state_to_plan(state, daily_sequence):
+    """
+    The plan dict for the values in state (a mapping such as st.session_state). The days
+    in daily_sequence are included as they are, not copied; serialize with plan_json().
+    """
+    data = {}
+    for key, path, _ in PLAN_FIELDS:
+        node = data
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+        value = state[key]
+        node[path[-1]] = value.isoformat() if key in DATE_FIELDS else value
+    data["planeacion"]["secuencia_diaria"] = daily_sequence
+    return data
+
+def changed_fields(state, incoming):
+    """
+    Compares incoming (from plan_to_state) with the current state and returns
+    (changed state keys, changed (dia_nombre, field) pairs of daily entries).
+    """
+    keys = [key for key, value in incoming.items() if state.get(key) != value]
+
+    current_days = state.get("daily_plan_data", {})
+    day_fields = []
+    for name, day in incoming["daily_plan_data"].items():
+        old = current_days.get(name, {})
+        day_fields.extend((name, field) for field in DAY_FIELDS if old.get(field, "") != day.get(field, ""))
+    return keys, day_fields
@@ -0,0 +1,215 @@
+"""
+Full-text search over an archive of saved plans (planeacion.json or .json.gz).
+
+Each text field (problemática, PDA, objetivos, ABPj phases, every daily
+inicio/desarrollo/cierre/...) is stripped of its Quill HTML and stored as one
+row of an SQLite FTS5 table. Re-indexing a directory only reads files whose
+size or mtime changed, and only re-tokenizes those whose content hash changed.
+
+    python plan_search.py indexar ARCHIVO_DIR
+    python plan_search.py buscar "texto a buscar"
+"""
+import argparse
+import hashlib
+import html
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from plan_format import is_plan_file, loads_plan
+
+INDEX_PATH = os.environ.get("PLANEADOR_INDICE", os.path.join(os.path.expanduser("~"), ".planeador", "indice.db"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    mtime_ns INTEGER, size INTEGER, sha256 TEXT,
+    label TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+    campo UNINDEXED, texto,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# A file's rows in docs use rowids [id * ROWS_PER_FILE, (id + 1) * ROWS_PER_FILE),
+# so they are replaced with a rowid range delete instead of a scan
+ROWS_PER_FILE = 1 << 16
+
+PLAN_TEXT_FIELDS = [
+    ("problematica", "Problemática"), ("pda", "PDA"), ("objetivos", "Objetivos"),
+    ("perfiles", "Perfiles de Egreso"), ("producto", "Producto Final"),
+]
+ABPJ_TEXT_FIELDS = [
+    ("presentacion", "Presentación"), ("recoleccion", "Recolección"), ("formulacion", "Formulación"),
+    ("organizacion", "Organización"), ("experiencia", "Vivamos la Experiencia"), ("resultados", "Resultados"),
+    ("materiales", "Materiales"), ("evaluacion", "Evaluación"),
+]
+DAY_TEXT_FIELDS = [
+    ("inicio", "Inicio"), ("desarrollo", "Desarrollo"), ("cierre", "Cierre"),
+    ("materiales", "Materiales"), ("evaluacion", "Evaluación"),
+]
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+def clean_html(t, sep=""):
+    """Drops the HTML tags of a Quill value; sep replaces each tag (use " " to keep words apart)."""
+    return _TAG_RE.sub(sep, t) if t else ""
+
+def _plain(t):
+    return " ".join(html.unescape(clean_html(t, " ")).split())
+
+def plan_texts(data):
+    """[(campo, plain text)] for every non-empty text field of a plan dict."""
+    plan = data.get("planeacion", {})
+    texts = [(label, plan.get(key)) for key, label in PLAN_TEXT_FIELDS]
+    abpj = plan.get("secuencia_abpj") or {}
+    texts += [(f"ABPj · {label}", abpj.get(key)) for key, label in ABPJ_TEXT_FIELDS]
+    for day in plan.get("secuencia_diaria", []):
+        texts += [(f"{day.get('dia_nombre', '')} · {label}", day.get(key)) for key, label in DAY_TEXT_FIELDS]
+    plain = [(campo, _plain(t)) for campo, t in texts if isinstance(t, str)]
+    return [(campo, t) for campo, t in plain if t]
+
+def plan_label(data):
+    curso = data.get("curso", {})
+    docente = data.get("docente", {})
+    plan = data.get("planeacion", {})
+    parts = [curso.get("materia"), curso.get("grado"), ", ".join(curso.get("grupos") or [])]
+    return " ".join(p for p in parts if p) + f" · {docente.get('nombre', '')} · {plan.get('fecha_inicio', '')}"
+
+class PlanIndex:
+    """FTS5 index stored in one SQLite file; safe to share across threads."""
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def index_directory(self, root, recursive=True):
+        """
+        Brings the index up to date with the plan files under root.
+        Returns a dict with the number of files indexed, unchanged, removed and failed.
+        """
+        if recursive:
+            found = [os.path.join(d, f) for d, _, files in os.walk(root) for f in files if is_plan_file(f)]
+        else:
+            found = [os.path.join(root, f) for f in os.listdir(root) if is_plan_file(f)]
+        found = {os.path.abspath(p) for p in found}
+        prefix = os.path.join(os.path.abspath(root), "")
+
+        stats = {"indexados": 0, "sin_cambios": 0, "eliminados": 0, "errores": 0}
+        conn = self._conn()
+        with self._write_lock, conn:
+            known = {row[0]: row[1:] for row in conn.execute(
+                "SELECT path, id, mtime_ns, size, sha256 FROM files WHERE path LIKE ? ESCAPE '\\'",
+                (prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",))}
+
+            for path in sorted(found):
+                try:
+                    st = os.stat(path)
+                    old = known.get(path)
+                    if old and old[1] == st.st_mtime_ns and old[2] == st.st_size:
+                        stats["sin_cambios"] += 1
+                        continue
+                    with open(path, "rb") as f:
+                        raw = f.read()
+                    digest = hashlib.sha256(raw).hexdigest()
+                    if old and old[3] == digest: # Touched but not edited
+                        conn.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?", (st.st_mtime_ns, st.st_size, path))
+                        stats["sin_cambios"] += 1
+                        continue
+                    data = loads_plan(raw)
+                    texts = plan_texts(data)
+                except (OSError, EOFError, ValueError, AttributeError, LookupError):
+                    stats["errores"] += 1
+                    continue
+
+                if old:
+                    file_id = old[0]
+                    self._delete_docs(conn, file_id)
+                    conn.execute("UPDATE files SET mtime_ns = ?, size = ?, sha256 = ?, label = ? WHERE id = ?",
+                                 (st.st_mtime_ns, st.st_size, digest, plan_label(data), file_id))
+                else:
+                    file_id = conn.execute("INSERT INTO files (path, mtime_ns, size, sha256, label) VALUES (?, ?, ?, ?, ?)",
+                                           (path, st.st_mtime_ns, st.st_size, digest, plan_label(data))).lastrowid
+                base = file_id * ROWS_PER_FILE
+                conn.executemany("INSERT INTO docs (rowid, campo, texto) VALUES (?, ?, ?)",
+                                 [(base + i, c, t) for i, (c, t) in enumerate(texts[:ROWS_PER_FILE])])
+                stats["indexados"] += 1
+
+            for path in set(known) - found:
+                self._delete_docs(conn, known[path][0])
+                conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                stats["eliminados"] += 1
+        return stats
+
+    @staticmethod
+    def _delete_docs(conn, file_id):
+        conn.execute("DELETE FROM docs WHERE rowid >= ? AND rowid < ?", (file_id * ROWS_PER_FILE, (file_id + 1) * ROWS_PER_FILE))
+
+    def search(self, query, limit=20):
+        """
+        Best matches for query (every word must start a word of the text, accents ignored) as dicts with
+        path, label, campo and a snippet where the matched words are wrapped in ** **.
+        """
+        words = query.split()
+        if not words:
+            return []
+        match = " ".join('"' + w.replace('"', '""') + '"*' for w in words) # Prefix match: "fraccion" finds "fracciones"
+        rows = self._conn().execute(
+            f"""SELECT files.path, files.label, docs.campo, snippet(docs, 1, '**', '**', '…', 16)
+               FROM docs JOIN files ON files.id = docs.rowid / {ROWS_PER_FILE}
+               WHERE docs MATCH ? ORDER BY bm25(docs) LIMIT ?""",
+            (f"texto : ({match})", limit)).fetchall()
+        return [{"path": p, "label": label, "campo": campo, "snippet": snippet} for p, label, campo, snippet in rows]
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    """The process-wide PlanIndex for INDEX_PATH."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PlanIndex()
+        return _index
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Índice de búsqueda de planeaciones archivadas.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_idx = sub.add_parser("indexar", help="Indexa (o actualiza) un directorio de planeaciones")
+    p_idx.add_argument("src_dir")
+    p_q = sub.add_parser("buscar", help="Busca texto en el índice")
+    p_q.add_argument("consulta")
+    p_q.add_argument("-n", type=int, default=20, help="Número máximo de resultados")
+    args = parser.parse_args(argv)
+
+    index = get_index()
+    t0 = time.perf_counter()
+    if args.cmd == "indexar":
+        if not os.path.isdir(args.src_dir):
+            parser.error(f"No existe el directorio: {args.src_dir}")
+        stats = index.index_directory(args.src_dir)
+        print(f"{stats['indexados']} indexados, {stats['sin_cambios']} sin cambios, "
+              f"{stats['eliminados']} eliminados, {stats['errores']} con error ({time.perf_counter() - t0:.2f}s)")
+    else:
+        for hit in index.search(args.consulta, args.n):
+            print(f"{hit['label']} [{hit['campo']}]\n    {hit['snippet']}\n    {hit['path']}")
+        print(f"({time.perf_counter() - t0:.3f}s)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Local SQLite repository of plans.
+
+Each plan is a row in `plans` with indexed metadata (docente, materia, grado,
+metodología, date range; grupos in `plan_grupos`) for cross-plan queries, and
+its content is stored one field per row in `plan_fields` (docente.nombre,
+planeacion.pda, dia/<dia_nombre>/inicio, ...). Saving compares against the
+stored fields and only writes the ones that changed.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from plan_pdf import parse_date
+from plan_schema import PLAN_FIELDS
+
+DB_PATH = os.environ.get("PLANEADOR_DB", os.path.join(os.path.expanduser("~"), ".planeador", "planeaciones.db"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY,
+    docente TEXT, materia TEXT, grado TEXT, grupos TEXT, metodologia TEXT,
+    fecha_inicio TEXT, fecha_fin TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS plan_grupos (
+    plan_id INTEGER REFERENCES plans(id) ON DELETE CASCADE,
+    grupo TEXT,
+    PRIMARY KEY (plan_id, grupo)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS plan_fields (
+    plan_id INTEGER REFERENCES plans(id) ON DELETE CASCADE,
+    path TEXT,
+    value TEXT,
+    PRIMARY KEY (plan_id, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS plans_materia_grado ON plans(materia, grado);
+CREATE INDEX IF NOT EXISTS plans_docente ON plans(docente);
+CREATE INDEX IF NOT EXISTS plans_metodologia ON plans(metodologia);
+CREATE INDEX IF NOT EXISTS plans_fechas ON plans(fecha_inicio, fecha_fin);
+CREATE INDEX IF NOT EXISTS plan_grupos_grupo ON plan_grupos(grupo, plan_id);
+"""
+
+_DAYS_PATH = "dias" # Ordered list of the plan's dia_nombre values
+_RUBRIC_PATH = ("planeacion", "secuencia_abpj", "rubrica_path")
+
+def flatten_plan(data):
+    """{path: JSON-encoded value} for a plan dict, one entry per field and per daily field."""
+    fields = {}
+    for _, path, default in PLAN_FIELDS:
+        node = data
+        for part in path:
+            node = node.get(part) if isinstance(node, dict) else None
+        fields[".".join(path)] = json.dumps(default if node is None else node, ensure_ascii=False)
+
+    days = data.get("planeacion", {}).get("secuencia_diaria", [])
+    fields[_DAYS_PATH] = json.dumps([day["dia_nombre"] for day in days], ensure_ascii=False)
+    for day in days:
+        for field, value in day.items():
+            if field != "dia_nombre":
+                fields[f"dia/{day['dia_nombre']}/{field}"] = json.dumps(value, ensure_ascii=False)
+    return fields
+
+def unflatten_plan(fields):
+    """Inverse of flatten_plan(), with the keys in the order the app writes them."""
+    data = {}
+    for _, path, default in PLAN_FIELDS:
+        node = data
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+        raw = fields.get(".".join(path))
+        node[path[-1]] = default if raw is None else json.loads(raw)
+
+    by_day = {}
+    for path, raw in fields.items():
+        if path.startswith("dia/"):
+            name, field = path[4:].rsplit("/", 1) # dia_nombre itself contains slashes
+            by_day.setdefault(name, {})[field] = json.loads(raw)
+    days = [{"dia_nombre": name, **by_day.get(name, {})} for name in json.loads(fields.get(_DAYS_PATH, "[]"))]
+    data.setdefault("planeacion", {})["secuencia_diaria"] = days
+    return data
+
+def _metadata(data):
+    curso = data.get("curso", {})
+    plan = data.get("planeacion", {})
+    grupos = curso.get("grupos") or []
+    return {
+        "docente": " ".join(x for x in [data.get("docente", {}).get("titulo"), data.get("docente", {}).get("nombre")] if x),
+        "materia": curso.get("materia"),
+        "grado": curso.get("grado"),
+        "grupos": ", ".join(grupos),
+        "metodologia": plan.get("metodologia"),
+        "fecha_inicio": parse_date(plan["fecha_inicio"]).isoformat() if plan.get("fecha_inicio") else None,
+        "fecha_fin": parse_date(plan["fecha_fin"]).isoformat() if plan.get("fecha_fin") else None,
+    }, grupos
+
+class PlanStore:
+    """Plan repository backed by one SQLite file; safe to share across Streamlit sessions."""
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        # One connection per thread: Streamlit runs each session's script on its own thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def save(self, data, plan_id=None):
+        """
+        Saves a plan dict (as returned by get_current_data()) as a new plan, or over
+        plan_id writing only the fields that differ from the stored copy.
+        Returns (plan_id, number of fields written).
+        """
+        conn = self._conn()
+        with conn:
+            return self._save(conn, data, plan_id)
+
+    def save_many(self, plans, skip_existing=False):
+        """
+        Saves an iterable of plan dicts as new plans in a single transaction; returns their ids.
+        With skip_existing, a plan whose docente, materia, grado, grupos and fecha_inicio are
+        already those of a stored plan is not saved, and its id in the list is None.
+        """
+        conn = self._conn()
+        with conn:
+            return [None if skip_existing and self._exists(conn, data) else self._save(conn, data)[0] for data in plans]
+
+    def _exists(self, conn, data):
+        meta, _ = _metadata(data)
+        keys = ("docente", "materia", "grado", "grupos", "fecha_inicio")
+        return conn.execute(f"SELECT 1 FROM plans WHERE {' AND '.join(f'{k} IS ?' for k in keys)} LIMIT 1",
+                            [meta[k] for k in keys]).fetchone() is not None
+
+    def rubric_paths(self):
+        """The rubric image paths stored plans refer to."""
+        rows = self._conn().execute("SELECT value FROM plan_fields WHERE path = ? OR path LIKE 'dia/%/rubrica_path'",
+                                    (".".join(_RUBRIC_PATH),))
+        return {path for path in (json.loads(value) for value, in rows) if path}
+
+    def _save(self, conn, data, plan_id=None):
+        fields = flatten_plan(data)
+        meta, grupos = _metadata(data)
+        if plan_id is not None and conn.execute("SELECT 1 FROM plans WHERE id = ?", (plan_id,)).fetchone() is None:
+            plan_id = None
+        if plan_id is None:
+            cur = conn.execute(
+                f"INSERT INTO plans ({', '.join(meta)}, updated_at) VALUES ({', '.join('?' * len(meta))}, ?)",
+                (*meta.values(), time.time()))
+            plan_id = cur.lastrowid
+            stored = {}
+        else:
+            conn.execute(
+                f"UPDATE plans SET {', '.join(f'{k} = ?' for k in meta)}, updated_at = ? WHERE id = ?",
+                (*meta.values(), time.time(), plan_id))
+            stored = dict(conn.execute("SELECT path, value FROM plan_fields WHERE plan_id = ?", (plan_id,)).fetchall())
+
+        changed = [(plan_id, path, value) for path, value in fields.items() if stored.get(path) != value]
+        removed = [(plan_id, path) for path in stored if path not in fields]
+        conn.executemany("INSERT OR REPLACE INTO plan_fields (plan_id, path, value) VALUES (?, ?, ?)", changed)
+        conn.executemany("DELETE FROM plan_fields WHERE plan_id = ? AND path = ?", removed)
+
+        conn.execute("DELETE FROM plan_grupos WHERE plan_id = ?", (plan_id,))
+        conn.executemany("INSERT OR IGNORE INTO plan_grupos (plan_id, grupo) VALUES (?, ?)", [(plan_id, g) for g in grupos])
+        return plan_id, len(changed) + len(removed)
+
+    def load(self, plan_id):
+        """The plan dict stored under plan_id, or None."""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM plans WHERE id = ?", (plan_id,)).fetchone() is None:
+            return None
+        return unflatten_plan(dict(conn.execute("SELECT path, value FROM plan_fields WHERE plan_id = ?", (plan_id,)).fetchall()))
+
+    def delete(self, plan_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM plans WHERE id = ?", (plan_id,))
+
+    def search(self, docente=None, materia=None, grado=None, grupo=None, metodologia=None, desde=None, hasta=None, limit=200):
+        """
+        Metadata rows (dicts) of the plans matching every given filter, newest first.
+        desde/hasta (ISO dates) select plans whose date range overlaps them; docente matches a substring.
+        """
+        where, params = [], []
+        for column, value in (("materia", materia), ("grado", grado), ("metodologia", metodologia)):
+            if value:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if docente:
+            where.append("docente LIKE ?")
+            params.append(f"%{docente}%")
+        if grupo:
+            where.append("id IN (SELECT plan_id FROM plan_grupos WHERE grupo = ?)")
+            params.append(grupo)
+        if desde:
+            where.append("fecha_fin >= ?")
+            params.append(str(desde))
+        if hasta:
+            where.append("fecha_inicio <= ?")
+            params.append(str(hasta))
+
+        sql = "SELECT * FROM plans"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        return [dict(row) for row in self._conn().execute(sql, (*params, limit))]
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """The process-wide PlanStore for DB_PATH."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PlanStore()
+        return _store
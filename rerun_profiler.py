@@ -0,0 +1,140 @@
+"""
+Opt-in per-rerun instrumentation of Planeador_st.py (PLANEADOR_PERFIL=1).
+
+Every script run is timed by named section (sidebar, floating-button assets,
+each tab, PDF status...). Its record also carries the widget count, an estimate
+of the size of st.session_state and the number of daily_plan_data entries.
+Fragment reruns, the deferred JSON download and PDF builds get records of their
+own. Records are kept per session for the debug panel and appended as JSON
+lines to METRICS_PATH for ops to scrape or graph:
+
+    {"ts": ..., "pid": ..., "sesion": ..., "tipo": "script", "total_ms": 41.2,
+     "secciones_ms": {"barra_lateral": 6.1, "tab4": 22.9, ...}, "widgets": 57,
+     "estado_kb": 312.4, "dias": 19}
+
+Sections may nest (a day's editors inside tab4), so they need not add up to
+total_ms. Disabled, section() does nothing and nothing is recorded.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("PLANEADOR_PERFIL") == "1"
+METRICS_PATH = os.environ.get("PLANEADOR_METRICAS", os.path.join(os.path.expanduser("~"), ".planeador", "metricas.jsonl"))
+HISTORY = 30 # Records kept per session for the debug panel
+
+_CURRENT = "_perfil_actual"
+_HISTORY = "_perfil_historial"
+_write_lock = threading.Lock()
+
+class RerunProfile:
+    """Section timings of one script run, fragment rerun or deferred callback."""
+    def __init__(self, kind):
+        self.kind = kind
+        self.sections = {}
+        self.finished = False
+        self._started = time.time()
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def section(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections[name] = self.sections.get(name, 0.0) + time.perf_counter() - t0
+
+    def record(self, state):
+        """The metrics record of this run, with the widget count and session-state size taken now."""
+        rec = {"ts": round(self._started, 3), "pid": os.getpid(), "sesion": None, "tipo": self.kind,
+               "total_ms": round(1000 * (time.perf_counter() - self._t0), 2),
+               "secciones_ms": {k: round(1000 * v, 2) for k, v in self.sections.items()},
+               "widgets": None, "estado_kb": round(state_size(state) / 1024, 1),
+               "dias": len(state.get("daily_plan_data") or ())}
+        try:
+            from streamlit.runtime.scriptrunner import get_script_run_ctx
+            ctx = get_script_run_ctx(suppress_warning=True)
+            if ctx is not None:
+                rec["sesion"] = ctx.session_id
+                rec["widgets"] = len(ctx.shared.widget_ids_this_run.snapshot())
+        except (ImportError, AttributeError):
+            pass
+        return rec
+
+def state_size(state):
+    """Approximate size in bytes of the values in a session-state mapping, leaving out the profiler's own."""
+    seen = set()
+    def size(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        n = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            n += sum(size(k) + size(v) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            n += sum(size(v) for v in obj)
+        elif hasattr(type(obj), "__slots__"): # plan_schema.DaySession
+            n += sum(size(getattr(obj, k)) for k in type(obj).__slots__ if hasattr(obj, k))
+        return n
+    return sum(size(k) + size(v) for k, v in state.items() if not str(k).startswith("_perfil"))
+
+def start(state, kind="script"):
+    """Starts the profile of a script run (call at the top of the script)."""
+    if ENABLED:
+        state[_CURRENT] = RerunProfile(kind)
+
+def finish(state):
+    """Closes the current profile: keeps its record for the panel and appends it to METRICS_PATH."""
+    profile = state.get(_CURRENT) if ENABLED else None
+    if profile is None or profile.finished:
+        return
+    profile.finished = True
+    _store(state, profile.record(state))
+
+@contextmanager
+def section(state, name, standalone=False):
+    """
+    Times a block under name in the current script run's profile. Outside a script run
+    (a fragment rerun, or a deferred callback with standalone) the block gets a record of its own.
+    """
+    if not ENABLED:
+        yield
+        return
+    profile = state.get(_CURRENT)
+    own = standalone or profile is None or profile.finished
+    if own:
+        profile = RerunProfile(name)
+        if not standalone:
+            state[_CURRENT] = profile
+    try:
+        with profile.section(name):
+            yield
+    finally:
+        if own:
+            profile.finished = True
+            _store(state, profile.record(state))
+
+def history(state):
+    """The session's latest records, oldest first."""
+    return list(state.get(_HISTORY, ()))
+
+def append_metrics(record):
+    """Appends one record as a JSON line to METRICS_PATH; metrics never break the app."""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(METRICS_PATH)), exist_ok=True)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with _write_lock, open(METRICS_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError:
+        pass
+
+def _store(state, record):
+    records = state.get(_HISTORY)
+    if records is None:
+        records = state[_HISTORY] = []
+    records.append(record)
+    del records[:-HISTORY]
+    append_metrics(record)
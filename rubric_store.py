@@ -0,0 +1,157 @@
+"""
+Content-addressed store for rubric images.
+
+Uploads are keyed by the SHA-256 of their bytes, so an image used on several
+days or by several sessions is written once. Images are downscaled to the
+resolution they print at in the PDF evaluation cell, and old files are evicted
+by age and by a total size quota.
+
+Saved plans keep the paths of their rubrics, so the store lives next to the plan
+repository ($PLANEADOR_RUBRICAS_DIR, by default ~/.planeador/rubricas). Loading
+or rendering a plan refreshes the age of its rubrics, and images a plan in the
+repository refers to are never evicted.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow missing: images are stored as uploaded
+    Image = None
+
+STORE_DIR = os.environ.get("PLANEADOR_RUBRICAS_DIR", os.path.join(os.path.expanduser("~"), ".planeador", "rubricas"))
+MAX_AGE_DAYS = 30
+REFRESH_AFTER_SECONDS = 86400 # PDF cache keys include the file's mtime, so it is not bumped on every render
+MAX_STORE_BYTES = 500 * 1024 * 1024
+
+# The PDF fits rubrics in an 8 x 4 inch box (evaluation column x 4 inch height)
+PRINT_BOX_INCHES = (8, 4)
+PRINT_DPI = 200
+
+_lock = threading.Lock()
+_by_upload_id = OrderedDict() # Streamlit upload file_id -> stored path
+
+def _prescale(data):
+    """Returns (bytes, extension) of the image resized to its printed size."""
+    if Image is None:
+        return data, None
+    try:
+        img = Image.open(io.BytesIO(data))
+        fmt = img.format
+        img = ImageOps.exif_transpose(img) # Phone photos carry their rotation in EXIF
+        img.thumbnail((PRINT_BOX_INCHES[0] * PRINT_DPI, PRINT_BOX_INCHES[1] * PRINT_DPI))
+        out = io.BytesIO()
+        if fmt == "JPEG":
+            img.convert("RGB").save(out, "JPEG", quality=85, optimize=True)
+            return out.getvalue(), ".jpg"
+        img.save(out, "PNG", optimize=True)
+        return out.getvalue(), ".png"
+    except Exception:
+        return data, None
+
+def store_rubric(data, name=""):
+    """Stores image bytes and returns the absolute path of the (pre-scaled) stored file."""
+    digest = hashlib.sha256(data).hexdigest()
+    os.makedirs(STORE_DIR, exist_ok=True)
+
+    for ext in (".jpg", ".png", os.path.splitext(name)[1].lower()):
+        path = os.path.join(STORE_DIR, digest + ext)
+        if ext and os.path.exists(path):
+            os.utime(path) # Refresh its age: it is still in use
+            return path
+
+    scaled, ext = _prescale(data)
+    path = os.path.join(STORE_DIR, digest + (ext or os.path.splitext(name)[1].lower() or ".img"))
+    fd, tmp = tempfile.mkstemp(dir=STORE_DIR, suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        f.write(scaled)
+    os.replace(tmp, path)
+
+    evict()
+    return path
+
+def store_rubric_upload(uploaded_file):
+    """
+    Stores a Streamlit UploadedFile. The uploader returns the same file on every
+    rerun, so files already stored in this process are not read or hashed again.
+    """
+    file_id = getattr(uploaded_file, "file_id", None)
+    with _lock:
+        path = _by_upload_id.get(file_id)
+    if path and os.path.exists(path):
+        return path
+
+    path = store_rubric(uploaded_file.getvalue(), uploaded_file.name)
+    if file_id:
+        with _lock:
+            _by_upload_id[file_id] = path
+            while len(_by_upload_id) > 1024:
+                _by_upload_id.popitem(last=False)
+    return path
+
+def plan_rubrics(data):
+    """Rubric image paths a plan dict refers to (ABPj rubric and daily sessions' rubrics)."""
+    plan = data.get("planeacion", {})
+    paths = [(plan.get("secuencia_abpj") or {}).get("rubrica_path")]
+    paths += [day.get("rubrica_path") for day in plan.get("secuencia_diaria") or []]
+    return [path for path in paths if path]
+
+def refresh_plan_rubrics(data):
+    """Refreshes the age of the stored rubrics of a plan dict that is being loaded or rendered."""
+    now = time.time()
+    store_dir = os.path.abspath(STORE_DIR)
+    for path in plan_rubrics(data):
+        if os.path.dirname(os.path.abspath(path)) != store_dir:
+            continue
+        try:
+            if now - os.stat(path).st_mtime > REFRESH_AFTER_SECONDS:
+                os.utime(path)
+        except OSError:
+            pass # Already gone; the PDF goes without it
+
+def _referenced_names():
+    """File names of the rubrics that plans in the repository refer to, or None if it cannot be read."""
+    try:
+        from plan_store import get_store
+        return {os.path.basename(path) for path in get_store().rubric_paths()}
+    except Exception:
+        return None
+
+def evict(max_age_days=MAX_AGE_DAYS, max_bytes=MAX_STORE_BYTES):
+    """
+    Deletes stored images older than max_age_days, then the oldest ones until the store fits
+    max_bytes, keeping those the plan repository refers to (nothing is deleted if it cannot be read).
+    """
+    if not os.path.isdir(STORE_DIR):
+        return
+    keep = _referenced_names()
+    if keep is None:
+        return
+    cutoff = time.time() - max_age_days * 86400
+    files = []
+    for entry in os.scandir(STORE_DIR):
+        if not entry.is_file() or entry.name in keep:
+            continue
+        st = entry.stat()
+        if st.st_mtime < cutoff:
+            _remove(entry.path)
+        else:
+            files.append((st.st_mtime, st.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
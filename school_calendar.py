@@ -0,0 +1,133 @@
+"""
+School calendar: class dates for a plan's (start, end, active days), skipping
+the non-working days of the official calendar (holidays, vacation weeks,
+Consejo Técnico days).
+
+The official calendar is read once per process from a CSV or ICS file:
+$PLANEADOR_CALENDARIO, or calendario_escolar.csv / calendario_escolar.ics next
+to the app. Without one, every selected weekday in the range is a class day.
+
+CSV rows are `fecha[,fecha_fin][,descripcion]` (ISO or DD/MM/YYYY, the range is
+inclusive); a header row is allowed. ICS files use the all-day VEVENTs.
+"""
+import csv
+import functools
+import os
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError: # Fall back to a day-by-day loop
+    np = None
+
+from assets import _get_full_path
+
+DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes"]
+CALENDAR_FILES = ["calendario_escolar.csv", "calendario_escolar.ics"]
+
+def parse_day(text):
+    """A date from ISO (AAAA-MM-DD), DD/MM/YYYY or AAAAMMDD text, or None if it is none of them."""
+    text = text.strip()
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%Y%m%d"):
+        try:
+            return datetime.strptime(text[:10] if fmt != "%Y%m%d" else text[:8], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def _expand(first, last, descripcion, out):
+    for i in range((last - first).days + 1):
+        out[first + timedelta(days=i)] = descripcion
+
+def _load_csv(path):
+    dias = {}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            first = parse_day(row[0])
+            if first is None:
+                continue # Header or comment row
+            last = parse_day(row[1]) if len(row) > 1 else None
+            rest = row[2:] if last or (len(row) > 2 and not row[1].strip()) else row[1:]
+            _expand(first, last or first, ",".join(rest).strip(), dias)
+    return dias
+
+def _load_ics(path):
+    with open(path, encoding="utf-8-sig") as f:
+        raw = f.read().replace("\r\n", "\n")
+    lines = raw.replace("\n ", "").replace("\n\t", "").split("\n") # Unfold continuation lines
+
+    dias = {}
+    event = None
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            event = {}
+        elif line == "END:VEVENT" and event is not None:
+            first = event.get("DTSTART")
+            if first:
+                # DTEND of an all-day event is exclusive
+                last = event["DTEND"] - timedelta(days=1) if event.get("DTEND") else first
+                _expand(first, max(first, last), event.get("SUMMARY", ""), dias)
+            event = None
+        elif event is not None and ":" in line:
+            name, value = line.split(":", 1)
+            name = name.split(";", 1)[0]
+            if name in ("DTSTART", "DTEND"):
+                event[name] = parse_day(value)
+            elif name == "SUMMARY":
+                event[name] = value.strip()
+    return dias
+
+def calendar_path():
+    path = os.environ.get("PLANEADOR_CALENDARIO")
+    if path:
+        return path if os.path.exists(path) else None
+    for name in CALENDAR_FILES:
+        path = _get_full_path(name)
+        if os.path.exists(path):
+            return path
+    return None
+
+@functools.lru_cache(maxsize=1)
+def official_non_working_days():
+    """{date: descripcion} from the official calendar file, loaded once per process."""
+    path = calendar_path()
+    if path is None:
+        return {}
+    if path.lower().endswith(".ics"):
+        return _load_ics(path)
+    return _load_csv(path)
+
+@functools.lru_cache(maxsize=256)
+def _class_dates(start, end, active_days, holidays):
+    weekmask = [1 if d in active_days else 0 for d in DIAS_SEMANA] + [0, 0]
+    if start > end or not any(weekmask): # No weekday selected (numpy rejects an all-zero weekmask)
+        return ()
+    if np is not None:
+        days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+        selected = days[np.is_busday(days, weekmask=weekmask, holidays=sorted(holidays))]
+        return tuple((d, DIAS_SEMANA[d.weekday()]) for d in selected.astype(object))
+
+    out = []
+    for i in range((end - start).days + 1):
+        current = start + timedelta(days=i)
+        wd = current.weekday()
+        if wd < 5 and DIAS_SEMANA[wd] in active_days and current not in holidays:
+            out.append((current, DIAS_SEMANA[wd]))
+    return tuple(out)
+
+def class_dates(start, end, active_days, holidays=None):
+    """
+    Class days between start and end (inclusive) as a tuple of (date, dia_nombre),
+    for the selected weekday names, skipping holidays (defaults to the official calendar).
+    Results are memoized per (range, days, holiday set).
+    """
+    if holidays is None:
+        holidays = official_non_working_days().keys()
+    return _class_dates(start, end, frozenset(active_days), frozenset(holidays))
+
+def non_working_days_in_range(start, end, active_days):
+    """[(date, descripcion)] official non-working days that fall on a selected weekday in the range."""
+    return sorted((d, desc) for d, desc in official_non_working_days().items()
+                  if start <= d <= end and d.weekday() < 5 and DIAS_SEMANA[d.weekday()] in active_days)
@@ -0,0 +1,356 @@
+"""
+Merged export of many plans (a subject's or a teacher's whole trimester) as one
+PDF with a table of contents and one bookmark per plan.
+
+Each plan is rendered on its own (optionally on a process pool) and its objects
+are copied into the output as soon as it is ready, so memory holds a few plan
+PDFs at a time plus the object offsets, however many plans are exported.
+Images and fonts that every plan repeats (the header logos) are written once.
+
+    python term_export.py trimestre.pdf --materia Matematicas --desde 2026-08-24 --hasta 2026-11-27
+    python term_export.py trimestre.pdf --dir PLANES_DIR [-r]
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from plan_format import read_plan
+from plan_pdf import render_index_pdf, render_plan_pdf
+from plan_search import plan_label
+
+_STARTXREF_RE = re.compile(rb'startxref\s+(\d+)')
+_XREF_RE = re.compile(rb'xref\s+0\s+(\d+)\s+')
+_OBJ_HEADER_RE = re.compile(rb'\d+\s+0\s+obj\s*')
+_STREAM_RE = re.compile(rb'>>\s*stream\r?\n')
+_REF_RE = re.compile(rb'(\d+) 0 R\b')
+_KIDS_RE = re.compile(rb'/Kids\s*\[([^\]]*)\]')
+_TOC_LINK_RE = re.compile(rb'/A\s*<<[^<>]*/URI\s*\(toc:(\d+)\)[^<>]*>>')
+_PAGE_RE = re.compile(rb'/Type\s*/Page\b')
+_SHAREABLE_SKIP_RE = re.compile(rb'/Type\s*/(Pages?|Catalog|Annot|Outlines)\b')
+
+def _pdf_text(text):
+    return b"<FEFF" + text.encode("utf-16-be").hex().upper().encode("ascii") + b">"
+
+def _parse(pdf):
+    """
+    Objects of a PDF written by ReportLab (classic xref table, no object streams):
+    ({number: (dictionary part, stream part)}, trailer /Root, trailer /Info).
+    Raises ValueError for anything else instead of misreading it.
+    """
+    def unsupported(reason):
+        return ValueError(f"PDF no admitido para unir ({reason}); solo se unen PDF generados por ReportLab")
+
+    starts = _STARTXREF_RE.findall(pdf)
+    if not pdf.startswith(b"%PDF-") or not starts:
+        raise unsupported("sin encabezado %PDF o sin startxref")
+    start = int(starts[-1])
+    m = _XREF_RE.match(pdf, start)
+    if m is None:
+        raise unsupported("tabla de referencias comprimida o en otra posición")
+    trailer_at = pdf.find(b"trailer", start)
+    if trailer_at < 0:
+        raise unsupported("sin trailer")
+    trailer = pdf[trailer_at:]
+    if re.search(rb'/(Prev|Encrypt)\b', trailer) or b"/ObjStm" in pdf:
+        raise unsupported("actualización incremental, cifrado o flujos de objetos")
+
+    count, pos = int(m.group(1)), m.end()
+    offsets = {}
+    for i in range(1, count):
+        entry = pdf[pos + 20 * i:pos + 20 * i + 18]
+        if entry.endswith(b"n"):
+            offsets[i] = int(entry[:10])
+
+    objects = {}
+    bounds = sorted(offsets.items(), key=lambda item: item[1])
+    for (num, begin), (_, end) in zip(bounds, bounds[1:] + [(None, start)]):
+        body = pdf[begin:end]
+        header = _OBJ_HEADER_RE.match(body)
+        if header is None or not body.startswith(b"%d 0 obj" % num) or b"endobj" not in body:
+            raise unsupported(f"el objeto {num} no está donde indica la tabla de referencias")
+        body = body[header.end():body.rindex(b"endobj")]
+        s = _STREAM_RE.search(body)
+        objects[num] = (body[:s.end()], body[s.end():]) if s else (body.rstrip(), b"")
+
+    root = re.search(rb'/Root\s+(\d+) 0 R', trailer)
+    if root is None or int(root.group(1)) not in objects:
+        raise unsupported("sin catálogo /Root")
+    info = re.search(rb'/Info\s+(\d+) 0 R', trailer)
+    return objects, int(root.group(1)), int(info.group(1)) if info else None
+
+class PdfConcatenator:
+    """
+    Streams the pages of ReportLab PDFs into one PDF written to fileobj (which need not be
+    seekable). add() copies a document's objects right away; close() writes the page tree,
+    the bookmarks and the cross-reference table.
+
+    Only PDFs as ReportLab's own writer produces them can be added: one classic
+    cross-reference table, every object written whole where the table says, no object
+    streams, incremental updates or encryption. Documents are read with regular
+    expressions, not a PDF parser, so add() raises ValueError for anything else
+    before writing any of it; other PDFs need a real PDF library.
+    """
+    def __init__(self, fileobj):
+        self._out = fileobj
+        self._pos = 0
+        self._offsets = [None] # Object number -> offset in the output; 0 is the free-list head
+        self._shared = {} # Content key -> object number, for images and fonts already written
+        self._pages_num = self._reserve()
+        self._write(b"%PDF-1.4\n%\x93\x8c\x8b\x9e\n")
+
+    def _reserve(self):
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def _write(self, data):
+        self._out.write(data)
+        self._pos += len(data)
+
+    def _write_object(self, num, data):
+        self._offsets[num] = self._pos
+        self._write(b"%d 0 obj\n" % num + data + b"\nendobj\n")
+
+    @staticmethod
+    def page_count(pdf):
+        objects, root, _ = _parse(pdf)
+        return len(PdfConcatenator._page_order(objects, root)[0])
+
+    @staticmethod
+    def _page_order(objects, root):
+        """(page object numbers in order, page-tree node numbers)."""
+        pages, nodes = [], []
+        def walk(num):
+            head = objects[num][0]
+            kids = _KIDS_RE.search(head)
+            if _PAGE_RE.search(head) and not kids:
+                pages.append(num)
+                return
+            nodes.append(num)
+            for ref in _REF_RE.findall(kids.group(1)) if kids else ():
+                walk(int(ref))
+        walk(int(re.search(rb'/Pages\s+(\d+) 0 R', objects[root][0]).group(1)))
+        return pages, nodes
+
+    def _shareable_keys(self, objects, skip):
+        """Content key of each object that may be shared with other documents (images, fonts, font dicts)."""
+        keys = {}
+        def key(num):
+            if num in keys:
+                return keys[num]
+            keys[num] = None # Guards reference cycles
+            head, stream = objects.get(num, (b"", b""))
+            if num in skip or _SHAREABLE_SKIP_RE.search(head) or (stream and b"/Subtype /Image" not in head):
+                return None
+            h = hashlib.blake2b(_REF_RE.sub(b"R", head) + stream, digest_size=16)
+            for ref in _REF_RE.findall(head):
+                k = key(int(ref))
+                if k is None:
+                    return None
+                h.update(k)
+            keys[num] = h.digest()
+            return keys[num]
+        for num in objects:
+            key(num)
+        return keys
+
+    def add(self, pdf, links=None):
+        """
+        Copies the pages of pdf (bytes) and everything they use into the output.
+        links maps the n of "toc:<n>" link URIs to page object numbers of the output.
+        Returns the output object numbers of the added pages, in order.
+        """
+        objects, root, info = _parse(pdf)
+        pages, nodes = self._page_order(objects, root)
+        outlines = re.search(rb'/Outlines\s+(\d+) 0 R', objects[root][0])
+        skip = {root, info, *nodes} | ({int(outlines.group(1))} if outlines else set())
+        keys = self._shareable_keys(objects, skip)
+
+        mapping = {node: self._pages_num for node in nodes}
+        new_shared = set()
+        for num in objects:
+            if num in skip:
+                continue
+            k = keys.get(num)
+            if k is not None and k in self._shared:
+                mapping[num] = self._shared[k]
+                continue
+            mapping[num] = self._reserve()
+            if k is not None:
+                self._shared[k] = mapping[num]
+                new_shared.add(num)
+
+        def renumber(m):
+            new = mapping.get(int(m.group(1)))
+            return b"%d 0 R" % new if new is not None else b"null"
+
+        for num, (head, stream) in objects.items():
+            if num in skip or (keys.get(num) is not None and num not in new_shared):
+                continue
+            head = _REF_RE.sub(renumber, head)
+            if links:
+                head = _TOC_LINK_RE.sub(lambda m: b"/Dest [ %d 0 R /Fit ]" % links[int(m.group(1))], head)
+            self._write_object(mapping[num], head + stream)
+        return [mapping[p] for p in pages]
+
+    def close(self, pages, outline=(), title=None):
+        """
+        Writes the document structure: pages (output page numbers, in reading order),
+        outline as top-level bookmarks [(title, page object number)], and the document title.
+        """
+        self._write_object(self._pages_num, b"<< /Count %d /Kids [ %s ] /Type /Pages >>" % (
+            len(pages), b" ".join(b"%d 0 R" % p for p in pages)))
+
+        catalog = b"/Pages %d 0 R /Type /Catalog" % self._pages_num
+        if outline:
+            outlines_num = self._reserve()
+            items = [self._reserve() for _ in outline]
+            for i, (text, page) in enumerate(outline):
+                links = b"/Parent %d 0 R" % outlines_num
+                if i:
+                    links += b" /Prev %d 0 R" % items[i - 1]
+                if i + 1 < len(items):
+                    links += b" /Next %d 0 R" % items[i + 1]
+                self._write_object(items[i], b"<< /Dest [ %d 0 R /Fit ] %s /Title %s >>" % (page, links, _pdf_text(text)))
+            self._write_object(outlines_num, b"<< /Count %d /First %d 0 R /Last %d 0 R /Type /Outlines >>" % (len(items), items[0], items[-1]))
+            catalog += b" /Outlines %d 0 R /PageMode /UseOutlines" % outlines_num
+        catalog_num = self._reserve()
+        self._write_object(catalog_num, b"<< " + catalog + b" >>")
+        info_num = self._reserve()
+        self._write_object(info_num, b"<< /Producer (Planeador Docente IMM)%s >>" % (b" /Title " + _pdf_text(title) if title else b""))
+
+        xref = self._pos
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % len(self._offsets))
+        self._write(b"".join(b"%010d 00000 n \n" % offset for offset in self._offsets[1:]))
+        self._write(b"trailer\n<< /Info %d 0 R /Root %d 0 R /Size %d >>\nstartxref\n%d\n%%%%EOF\n" % (
+            info_num, catalog_num, len(self._offsets), xref))
+
+def _rendered(plans, executor, window):
+    """(label, PDF bytes or exception) per plan, in order, with at most window plans in flight."""
+    if executor is None:
+        for data in plans:
+            try:
+                yield plan_label(data), render_plan_pdf(data)
+            except Exception as e:
+                yield plan_label(data), e
+        return
+
+    in_flight = deque()
+    def pop():
+        label, future = in_flight.popleft()
+        try:
+            return label, future.result()
+        except Exception as e:
+            return label, e
+    for data in plans:
+        in_flight.append((plan_label(data), executor.submit(render_plan_pdf, data)))
+        if len(in_flight) >= window:
+            yield pop()
+    while in_flight:
+        yield pop()
+
+def export_term(plans, fileobj, title="Planeaciones", executor=None, window=4, total=None, progress=None):
+    """
+    Writes one PDF with every plan dict of plans (any iterable; read lazily) to fileobj,
+    preceded by a table of contents. executor (e.g. a ProcessPoolExecutor) renders up to
+    window plans ahead in parallel. progress, if given, is called as
+    progress("planes", done, total) after each plan; raising from it aborts the export.
+    Returns (contents [(label, first page, page count)], errors [(label, message)]).
+    """
+    report = progress or (lambda phase, done, total: None)
+    writer = PdfConcatenator(fileobj)
+    parts, errors = [], []
+    for done, (label, pdf) in enumerate(_rendered(plans, executor, window), 1):
+        if not isinstance(pdf, Exception):
+            try:
+                parts.append((label, writer.add(pdf)))
+            except ValueError as e: # Not a PDF PdfConcatenator can read; nothing of it was written
+                pdf = e
+        if isinstance(pdf, Exception):
+            errors.append((label, f"{type(pdf).__name__}: {(str(pdf).splitlines() or [''])[0]}"))
+        report("planes", done, total or done)
+
+    # Page numbers in the index depend on its own length, which depends on them only through line breaks
+    index_pages = 1
+    while True:
+        contents, page = [], index_pages + 1
+        for label, pages in parts:
+            contents.append((label, page, len(pages)))
+            page += len(pages)
+        index_pdf = render_index_pdf([(label, first) for label, first, _ in contents])
+        n = PdfConcatenator.page_count(index_pdf)
+        if n == index_pages:
+            break
+        index_pages = n
+
+    index = writer.add(index_pdf, links=[pages[0] for _, pages in parts])
+    all_pages = index + [p for _, pages in parts for p in pages]
+    writer.close(all_pages, [("Índice", index[0])] + [(label, pages[0]) for label, pages in parts], title)
+    return contents, errors
+
+def _directory_plans(files):
+    for path in files:
+        try:
+            yield read_plan(path)
+        except (OSError, EOFError, ValueError) as e:
+            print(f"  {path}: {type(e).__name__}: {e}", file=sys.stderr)
+
+def repository_plans(store, rows):
+    """The plans of PlanStore.search() rows in term order (start date, materia, grado, grupos), loaded one at a time."""
+    for row in sorted(rows, key=lambda r: (r["fecha_inicio"] or "", r["materia"] or "", r["grado"] or "", r["grupos"] or "")):
+        data = store.load(row["id"])
+        if data is not None:
+            yield data
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta varias planeaciones en un solo PDF con índice y marcadores.")
+    parser.add_argument("salida", help="Archivo PDF a generar")
+    parser.add_argument("--dir", dest="src_dir", help="Exportar las planeaciones (JSON) de este directorio en vez del repositorio")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Con --dir, buscar también en subdirectorios")
+    parser.add_argument("--materia")
+    parser.add_argument("--docente", help="Parte del nombre del docente")
+    parser.add_argument("--grado")
+    parser.add_argument("--grupo")
+    parser.add_argument("--desde", help="AAAA-MM-DD")
+    parser.add_argument("--hasta", help="AAAA-MM-DD")
+    parser.add_argument("--titulo", default="Planeaciones")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Procesos en paralelo (por defecto: núcleos disponibles)")
+    args = parser.parse_args(argv)
+
+    if args.src_dir:
+        if not os.path.isdir(args.src_dir):
+            parser.error(f"No existe el directorio: {args.src_dir}")
+        from batch_pdf import find_plan_files
+        files = find_plan_files(args.src_dir, args.recursive)
+        plans, total = _directory_plans(files), len(files)
+    else:
+        from plan_store import get_store
+        store = get_store()
+        rows = store.search(docente=args.docente, materia=args.materia, grado=args.grado, grupo=args.grupo,
+                            desde=args.desde, hasta=args.hasta, limit=100_000)
+        plans, total = repository_plans(store, rows), len(rows)
+    if not total:
+        print("No hay planeaciones que exportar.", file=sys.stderr)
+        return 1
+
+    t0 = time.perf_counter()
+    jobs = args.jobs or os.cpu_count() or 1
+    with open(args.salida, "wb") as f:
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                contents, errors = export_term(plans, f, args.titulo, executor=pool, window=2 * jobs, total=total)
+        else:
+            contents, errors = export_term(plans, f, args.titulo, total=total)
+
+    pages = sum(n for _, _, n in contents)
+    print(f"{len(contents)} planeaciones, {pages} páginas, {len(errors)} con error -> {args.salida} ({time.perf_counter() - t0:.2f}s)")
+    for label, error in errors:
+        print(f"  {label}: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import random
+import string
+
+from plan_pdf import CHUNK_LINES, render_plan_pdf, split_markup
+from plan_schema import state_defaults, state_to_plan
+
+def test_split_markup_cuts_a_word_longer_than_a_chunk():
+    word = "".join(random.Random(0).choices(string.ascii_letters + "/+=", k=20000))
+    chunks = split_markup(f"<b>{word}</b>", 40)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 40 * CHUNK_LINES + len("<b></b>") for chunk in chunks)
+    assert "".join(chunk[len("<b>"):-len("</b>")] for chunk in chunks) == word
+
+def test_split_markup_keeps_entities_whole():
+    word = "a&amp;" * 2000
+    chunks = split_markup(word, 40)
+    assert all(chunk.count("&") == chunk.count("&amp;") for chunk in chunks)
+    assert "".join(chunks) == word
+
+def test_pdf_with_a_20kb_spaceless_field():
+    word = "".join(random.Random(1).choices(string.ascii_letters + "/+=", k=20000))
+    state = state_defaults()
+    state["text_problematica"] = f"<p>https://ejemplo.mx/{word}</p>"
+    assert render_plan_pdf(state_to_plan(state, [])).startswith(b"%PDF-")
@@ -0,0 +1,19 @@
+from datetime import date
+
+import school_calendar
+from school_calendar import class_dates
+
+def test_class_dates_without_weekdays():
+    start, end = date(2026, 8, 24), date(2026, 9, 4)
+    assert class_dates(start, end, ["Sábado"], holidays=()) == ()
+    assert class_dates(start, end, ["Sábado", "Domingo"]) == ()
+    assert class_dates(start, end, []) == ()
+
+def test_class_dates_skips_days_outside_monday_to_friday(monkeypatch):
+    start, end = date(2026, 8, 24), date(2026, 9, 4)
+    expected = ((date(2026, 8, 26), "Miércoles"), (date(2026, 9, 2), "Miércoles"))
+    assert class_dates(start, end, ["Miércoles", "Sábado"], holidays=()) == expected
+    monkeypatch.setattr(school_calendar, "np", None) # Day-by-day fallback without numpy
+    school_calendar._class_dates.cache_clear()
+    assert class_dates(start, end, ["Sábado"], holidays=()) == ()
+    assert class_dates(start, end, ["Miércoles", "Sábado"], holidays=()) == expected
@@ -0,0 +1,190 @@
+"""
+Skeleton plans from a school timetable: one plan per teacher, materia, grado and
+grupos, with the date range and dias_planeados filled in and an empty daily
+session per class day, ready to be opened and written in the app.
+
+    python timetable_import.py horario.csv -o PLANES_DIR [--comprimido]
+    python timetable_import.py horario.csv --repositorio [--desde 2026-08-24 --hasta 2026-11-27]
+
+The CSV (comma or semicolon separated, with a header row) has the columns
+docente, materia, grado, grupos and dias, and optionally titulo, campo,
+metodologia, fecha_inicio and fecha_fin (ISO or DD/MM/YYYY). Several groups or
+days go in one cell separated by spaces, commas, semicolons or "/". Rows that
+only differ in their days (a timetable with one row per class slot) are merged
+into one plan. With --repositorio, plans already in the repository (same
+docente, materia, grado, grupos and fecha_inicio) are skipped.
+"""
+import argparse
+import csv
+import io
+import os
+import re
+import sys
+import time
+import unicodedata
+
+from plan_format import COMPACT_SUFFIX, dumps_compact, plan_stem
+from plan_schema import empty_day, plan_json, state_defaults, state_to_plan
+from school_calendar import DIAS_SEMANA, class_dates, parse_day
+
+REQUIRED_COLUMNS = ("docente", "materia", "grado", "grupos", "dias")
+_COLUMN_ALIASES = {"grupo": "grupos", "dia": "dias", "dias_de_clase": "dias", "inicio": "fecha_inicio", "fin": "fecha_fin"}
+_LIST_SEP_RE = re.compile(r"[\s,;/]+")
+_UNSAFE_RE = re.compile(r"[^\w.-]+")
+
+def _fold(text):
+    """Lowercase without accents ("Miércoles" -> "miercoles")."""
+    return "".join(c for c in unicodedata.normalize("NFD", text.strip().lower()) if unicodedata.category(c) != "Mn")
+
+_DIAS = {_fold(d): d for d in DIAS_SEMANA}
+
+def read_timetable(text, desde=None, hasta=None):
+    """
+    Parses the timetable CSV text into plan rows: dicts with docente, titulo, materia,
+    grado, grupos (tuple), campo, metodologia, fecha_inicio, fecha_fin (dates) and dias
+    (in weekday order), one per plan. desde/hasta are the dates of rows without their own.
+    Raises ValueError naming the CSV line of the first invalid row.
+    """
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    columns = {name: _COLUMN_ALIASES.get(_fold(name).replace(" ", "_"), _fold(name).replace(" ", "_")) for name in reader.fieldnames or ()}
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns.values()]
+    if missing:
+        raise ValueError(f"Faltan columnas en el horario: {', '.join(missing)}")
+
+    plans = {}
+    for row in reader:
+        cells = {columns[k]: (v or "").strip() for k, v in row.items() if k in columns}
+        if not any(cells.values()):
+            continue
+        line = reader.line_num
+        for c in REQUIRED_COLUMNS:
+            if not cells.get(c):
+                raise ValueError(f"Línea {line}: falta {c}")
+
+        dias = set()
+        for dia in _LIST_SEP_RE.split(cells["dias"]):
+            if dia and _fold(dia) not in _DIAS:
+                raise ValueError(f"Línea {line}: día no válido: {dia}")
+            if dia:
+                dias.add(_DIAS[_fold(dia)])
+        fechas = []
+        for c, default in (("fecha_inicio", desde), ("fecha_fin", hasta)):
+            value = parse_day(cells[c]) if cells.get(c) else default
+            if value is None:
+                raise ValueError(f"Línea {line}: {c} no válida" if cells.get(c) else f"Línea {line}: falta {c} y no se indicó el periodo")
+            fechas.append(value)
+        if fechas[0] > fechas[1]:
+            raise ValueError(f"Línea {line}: fecha_inicio posterior a fecha_fin")
+
+        grupos = tuple(sorted(g.upper() for g in _LIST_SEP_RE.split(cells["grupos"]) if g))
+        key = (cells.get("titulo", ""), cells["docente"], cells["materia"], cells["grado"], grupos,
+               cells.get("campo", ""), cells.get("metodologia", ""), fechas[0], fechas[1])
+        plan = plans.get(key)
+        if plan is None:
+            plan = plans[key] = {"titulo": key[0], "docente": key[1], "materia": key[2], "grado": key[3], "grupos": grupos,
+                                 "campo": key[5], "metodologia": key[6], "fecha_inicio": fechas[0], "fecha_fin": fechas[1], "dias": set()}
+        plan["dias"] |= dias
+
+    rows = list(plans.values())
+    for plan in rows:
+        plan["dias"] = [d for d in DIAS_SEMANA if d in plan["dias"]]
+    return rows
+
+def skeleton_plans(rows):
+    """
+    Yields (row, plan dict) for plan rows from read_timetable(). The plan dicts have the
+    shape of get_current_data(), with an empty daily session per class day. The class
+    days of each distinct (range, days) are worked out once and shared by its plans.
+    """
+    day_names = {}
+    for row in rows:
+        span = (row["fecha_inicio"], row["fecha_fin"], tuple(row["dias"]))
+        names = day_names.get(span)
+        if names is None:
+            names = day_names[span] = [f"{dia_nombre} {current.strftime('%d/%m/%Y')}" for current, dia_nombre in class_dates(*span)]
+
+        state = state_defaults()
+        state.update(docente_nombre=row["docente"], curso_materia=row["materia"], curso_grado=row["grado"],
+                     curso_grupos=list(row["grupos"]), plan_fecha_inicio=row["fecha_inicio"],
+                     plan_fecha_fin=row["fecha_fin"], plan_dias=list(row["dias"]))
+        for key, column in (("docente_titulo", "titulo"), ("curso_campo", "campo"), ("plan_metodologia", "metodologia")):
+            if row[column]:
+                state[key] = row[column]
+        yield row, state_to_plan(state, [empty_day(name) for name in names])
+
+def plan_file_name(row, compact=False):
+    """File name of a skeleton plan: docente_materia_grado_grupos_inicio.json (or .json.gz)."""
+    parts = (row["docente"], row["materia"], row["grado"], "".join(row["grupos"]), row["fecha_inicio"].isoformat())
+    stem = "_".join(_UNSAFE_RE.sub("-", _fold(p)).strip("-") for p in parts)
+    return stem + (COMPACT_SUFFIX if compact else ".json")
+
+def write_plans(plans, out_dir, compact=False):
+    """Writes (row, plan) pairs as plan files in out_dir; returns the paths written."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    used = set()
+    for row, data in plans:
+        name = plan_file_name(row, compact)
+        stem, suffix = plan_stem(name), name[len(plan_stem(name)):]
+        n = 2
+        while name in used: # Same teacher, class and start date, differing in campo, metodologia or end date
+            name = f"{stem}_{n}{suffix}"
+            n += 1
+        used.add(name)
+        path = os.path.join(out_dir, name)
+        if compact:
+            with open(path, "wb") as f:
+                f.write(dumps_compact(data))
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(plan_json(data, indent=4))
+        paths.append(path)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crea las planeaciones vacías de un periodo a partir del horario escolar (CSV).")
+    parser.add_argument("horario", help="Archivo CSV del horario")
+    destino = parser.add_mutually_exclusive_group(required=True)
+    destino.add_argument("-o", "--out", dest="out_dir", help="Directorio donde escribir las planeaciones (JSON)")
+    destino.add_argument("--repositorio", action="store_true", help="Guardarlas en el repositorio de planeaciones")
+    parser.add_argument("--comprimido", action="store_true", help="Con -o, escribir .json.gz (formato compacto)")
+    parser.add_argument("--desde", help="Fecha de inicio de las filas sin fecha_inicio (AAAA-MM-DD)")
+    parser.add_argument("--hasta", help="Fecha de fin de las filas sin fecha_fin (AAAA-MM-DD)")
+    args = parser.parse_args(argv)
+
+    desde = parse_day(args.desde) if args.desde else None
+    hasta = parse_day(args.hasta) if args.hasta else None
+    if (args.desde and desde is None) or (args.hasta and hasta is None):
+        parser.error("Fechas no válidas en --desde/--hasta")
+
+    t0 = time.perf_counter()
+    try:
+        with open(args.horario, encoding="utf-8-sig", newline="") as f:
+            rows = read_timetable(f.read(), desde, hasta)
+    except (OSError, ValueError) as e:
+        print(f"{args.horario}: {e}", file=sys.stderr)
+        return 1
+
+    if args.repositorio:
+        from plan_store import get_store
+        store = get_store()
+        ids = store.save_many((data for _, data in skeleton_plans(rows)), skip_existing=True)
+        saved = [i for i in ids if i is not None]
+        if not ids:
+            print("El horario no tiene filas.")
+        else:
+            print(f"{len(saved)} planeaciones guardadas en {store.path}" + (f" (#{saved[0]} a #{saved[-1]})" if saved else ""))
+            if len(saved) < len(ids):
+                print(f"{len(ids) - len(saved)} ya estaban en el repositorio y se omitieron")
+    else:
+        paths = write_plans(skeleton_plans(rows), args.out_dir, args.comprimido)
+        print(f"{len(paths)} planeaciones escritas en {args.out_dir}")
+    print(f"{time.perf_counter() - t0:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())